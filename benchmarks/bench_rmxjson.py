@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Micro-benchmark of the json serialization of container documents.
+
+Compares the encode/decode round-trip through RmxEncoder with
+rmxjson.to_json_ready and rmxjson.dumps, on a container holding 10k+ url
+objects.
+
+Usage: python benchmarks/bench_rmxjson.py [number-of-url-objects]
+"""
+import datetime
+import json
+import sys
+import timeit
+import uuid
+
+import bson
+
+from rmxbot.contrib.rmxjson import RmxEncoder, dumps, to_json_ready
+
+
+def make_container(size: int = 10000) -> dict:
+    """Returns a container document as it is read from mongodb."""
+    return {
+        '_id': bson.ObjectId(),
+        'name': 'benchmark',
+        'created': datetime.datetime.now(),
+        'updated': datetime.datetime.now(),
+        'crawl_ready': True,
+        'status': [],
+        'urls': [{
+            'data_id': str(bson.ObjectId()),
+            'file_id': uuid.uuid4().hex,
+            'texthash': uuid.uuid4().hex,
+            'title': f'Page number {_}',
+            'url': f'https://example.com/page/{_}/',
+        } for _ in range(size)]
+    }
+
+
+def main(size: int = 10000, number: int = 20):
+
+    doc = make_container(size)
+    encoder = RmxEncoder()
+
+    if to_json_ready(doc) != json.loads(encoder.encode(doc)):
+        raise RuntimeError('The outputs differ.')
+
+    cases = [
+        ('json.loads(RmxEncoder().encode(doc))',
+         lambda: json.loads(encoder.encode(doc))),
+        ('to_json_ready(doc)', lambda: to_json_ready(doc)),
+        ('RmxEncoder().encode(doc).encode()',
+         lambda: encoder.encode(doc).encode('utf-8')),
+        ('dumps(doc)', lambda: dumps(doc)),
+    ]
+    print(f'container with {size} url objects, best of 5 x {number} runs')
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print(f'{name:<40} {best * 1000:9.3f} ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
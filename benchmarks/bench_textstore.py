@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Benchmark of the text stores: compression ratio and read latency.
+
+The texts of a crawl (the text folder of a container, one file per text) are
+written to a file store and to segment stores with every available codec;
+the script reports the size on disk, the compression ratio, the write time
+and the latency of reading whole texts and the first 2kB of texts.
+
+Usage: python benchmarks/bench_textstore.py <container-text-folder> [reads]
+"""
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('TEMPLATES_FOLDER', '')
+os.environ.setdefault('DATA_ROOT', tempfile.gettempdir())
+
+from rmxbot.config import SEGMENTS_FOLDER, TEXT_FOLDER  # noqa: E402
+from rmxbot.core.textstore import FileStore, SegmentStore  # noqa: E402
+from rmxbot.core.textstore.codecs import zstandard  # noqa: E402
+
+
+def load_texts(path: str) -> dict:
+
+    texts = {}
+    for name in os.listdir(path):
+        _path = os.path.join(path, name)
+        if os.path.isfile(_path):
+            with open(_path, 'rb') as _file:
+                texts[name] = _file.read()
+    return texts
+
+
+def disk_usage(path: str) -> int:
+
+    return sum(os.path.getsize(os.path.join(root, _))
+               for root, _dirs, files in os.walk(path) for _ in files)
+
+
+def make_store(root: str, name: str):
+
+    texts_path = os.path.join(root, name, TEXT_FOLDER)
+    os.makedirs(texts_path)
+    if name == 'files':
+        return FileStore(texts_path)
+    os.makedirs(os.path.join(root, name, SEGMENTS_FOLDER))
+    compression = name.split('+')[0]
+    return SegmentStore(texts_path,
+                        compression='' if compression == 'raw' else
+                        compression)
+
+
+def latency(func, fileids: list) -> tuple:
+    """Returns the median and 95th percentile latency in ms."""
+    timings = []
+    for fileid in fileids:
+        start = time.perf_counter()
+        func(fileid)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * .95)]
+
+
+def main(path: str, reads: int = 1000):
+
+    texts = load_texts(path)
+    raw_size = sum(len(_) for _ in texts.values())
+    print(f'{len(texts)} texts, {raw_size / 1024 ** 2:.1f} MB')
+
+    cases = ['files', 'raw', 'zlib']
+    if zstandard is not None:
+        cases.extend(['zstd', 'zstd+dict'])
+
+    root = tempfile.mkdtemp()
+    sample = random.choices(list(texts), k=reads)
+    print(f'{"store":<12}{"MB":>9}{"ratio":>8}{"write s":>9}'
+          f'{"read p50":>10}{"read p95":>10}{"2kB p50":>9}{"2kB p95":>9}')
+    try:
+        for name in cases:
+            store = make_store(root, name)
+            start = time.perf_counter()
+            for fileid, data in texts.items():
+                store.write(fileid, data)
+            if name == 'zstd+dict':
+                store.train_dictionary()
+                store.compact()
+            written = time.perf_counter() - start
+            size = disk_usage(os.path.join(root, name))
+            for fileid in sample[:10]:
+                if store.read(fileid) != texts[fileid]:
+                    raise RuntimeError(f'{name}: {fileid} differs.')
+            full = latency(store.read, sample)
+            page = latency(lambda _: store.read_range(_, 0, 2048), sample)
+            print(f'{name:<12}{size / 1024 ** 2:9.1f}{raw_size / size:8.2f}'
+                  f'{written:9.2f}{full[0]:10.3f}{full[1]:10.3f}'
+                  f'{page[0]:9.3f}{page[1]:9.3f}')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
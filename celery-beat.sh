@@ -0,0 +1,5 @@
+#!/bin/sh
+
+# the periodic tasks are sent by one beat process per deployment; do not
+# scale this service.
+celery -A celery_worker beat --loglevel=INFO
@@ -1,4 +1,3 @@
 #!/bin/sh
 
 celery -A celery_worker worker --loglevel=INFO -Q rmxbot
-
@@ -10,6 +10,13 @@ This command will run the celery worker:
 or
 `celery -A rmxbot.celery_worker worker --loglevel=debug`
 (for a more verbose standard output).
+
+The periodic tasks (beat_schedule in rmxbot.tasks.celeryconf) are sent by
+celery beat, which runs on its own (celery-beat.sh):
+`celery -A rmxbot.celery_worker beat`.
+Exactly one beat process must run per deployment: every beat process sends
+every periodic task, so workers are not started with -B, as each replica
+would run a scheduler.
 """
 
 from rmxbot.app import celery
@@ -0,0 +1,97 @@
+"""Tracking the activity of crawls.
+
+Containers that are being crawled are kept in a redis sorted set, scored by
+the time of their last activity: the start of the crawl and every page saved
+by create_from_webpage. A crawl is over when no page was saved for
+SECONDS_AFTER_LAST_CALL seconds; the crawls that are over are found by the
+sweeper (tasks.container.sweep_crawls).
+
+A finished crawl is marked for FINISHED_TTL seconds, so that pages saved
+after the end of the crawl do not make it active again (and the crawl is not
+finished twice); the mark is removed when a new crawl of the container
+starts.
+"""
+import time
+
+import bson
+
+from ...config import SECONDS_AFTER_LAST_CALL
+from ...contrib.db.redis_connection import get_redis
+
+_KEY = 'rmxbot:crawls:active'
+_FINISHED = 'rmxbot:crawls:finished:{}'
+
+FINISHED_TTL = 86400
+
+# removing a crawl only if it had no activity since the cutoff, so that a
+# page saved while the sweeper runs keeps the crawl active; the crawl is
+# marked as finished.
+_FINISH = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) <= tonumber(ARGV[2]) then
+    redis.call('SET', KEYS[2], 1, 'EX', ARGV[3])
+    return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# registering activity, unless the crawl is finished.
+_TOUCH = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return 1
+"""
+
+# the scripts, registered once per process; these are sent by their sha.
+_SCRIPTS = {}
+
+
+def _script(source: str):
+
+    if source not in _SCRIPTS:
+        _SCRIPTS[source] = get_redis().register_script(source)
+    return _SCRIPTS[source]
+
+
+def start(containerid: (str, bson.ObjectId) = None):
+    """Registering the start of a crawl; this adds the container to the
+       active crawls, also if a previous crawl of it is finished.
+    """
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(_FINISHED.format(containerid))
+    pipe.zadd(_KEY, {str(containerid): time.time()})
+    return pipe.execute()[-1]
+
+
+def touch(containerid: (str, bson.ObjectId) = None) -> bool:
+    """Registering activity for the crawl of a container. Returns False if
+       the crawl is finished; the container is not made active again.
+    """
+    return bool(_script(_TOUCH)(
+        keys=[_KEY, _FINISHED.format(containerid)],
+        args=[str(containerid), time.time()]))
+
+
+def activity() -> dict:
+    """Returns the time of the last activity of every active crawl."""
+    return {
+        k.decode('utf-8'): v
+        for k, v in get_redis().zrange(_KEY, 0, -1, withscores=True)
+    }
+
+
+def cutoff(seconds: int = SECONDS_AFTER_LAST_CALL) -> float:
+    """Returns the time before which crawls without activity are over."""
+    return time.time() - seconds
+
+
+def finish(containerid: (str, bson.ObjectId), before: float) -> bool:
+    """Removing a crawl from the active ones and marking it as finished.
+       Returns False if it had activity since before, or if it was removed by
+       another sweeper.
+    """
+    return bool(_script(_FINISH)(
+        keys=[_KEY, _FINISHED.format(containerid)],
+        args=[str(containerid), before, FINISHED_TTL]))
@@ -2,51 +2,68 @@
    return json objects.
 """
 
-import json
-import os
 import typing
-import uuid
 
 from flask import abort, request
 import pymongo
 
 from ...app import celery
 from ...config import (DEFAULT_CRAWL_DEPTH, EXTRACTXT_FILES_UPLOAD_URL)
-from ...contrib.rmxjson import RmxEncoder
+from ...contrib.db.models.document import encode_cursor
+from ...contrib.rmxjson import to_json_ready
+from ...core import jobs
+from ...core.context_index import search_job
+from ...core.text_index import read_paragraphs
 from ..data.models import DataModel, LISTURLS_PROJECT
 from .decorators import neo_availability
+from .graph import build_graph
 from .models import (ContainerModel, container_status, request_availability,
                      set_crawl_ready)
 from .status import status_text
-from ...tasks.celeryconf import RMXBOT_TASKS, RMXGREP_TASK
+from . import urlobjects
+from ...tasks.celeryconf import RMXBOT_TASKS
 from ...tasks.container import crawl_async, delete_data_from_container
 
 ERR_MSGS = dict(container_does_not_exist='A container with id: "{}" does not exist.')
 
 
-def paginate(start: int = 0, limit: int = 100):
+def paginate(start: int = 0, limit: int = 100, after: str = None):
     """
-    Paginates the collection that holds corpora.
+    Paginates the collection that holds corpora. Every item holds a cursor;
+    the next page starts after the cursor of the last item. The 'start'
+    offset is supported for backwards compatibility.
     :param start:
     :param limit:
+    :param after:
     :return:
     """
-    cursor = ContainerModel.range_query(
-        query={'crawl_ready': True},
-        projection=dict(),
-        limit=limit,
-        start=start,
-        direction=pymongo.DESCENDING)
-    encoder = RmxEncoder()
+    if start and not after:
+        cursor = ContainerModel.range_query(
+            query={'crawl_ready': True},
+            projection=dict(),
+            limit=limit,
+            start=start,
+            direction=pymongo.DESCENDING)
+    else:
+        cursor = ContainerModel.keyset_query(
+            query={'crawl_ready': True},
+            after=after,
+            limit=limit,
+            direction=pymongo.DESCENDING)
+    items = list(cursor)
+    # url objects of large containers, with one query
+    first_urls = urlobjects.first_urls(
+        [_['_id'] for _ in items if _.get('large_container')])
 
     def process_id(_):
 
+        _['cursor'] = encode_cursor(_)
+        if _['_id'] in first_urls:
+            _['urls'] = first_urls[_['_id']]
         _['containerid'] = _.get('_id')
         del _['_id']
         return _
-    return [
-        json.loads(encoder.encode(process_id(item))) for item in cursor
-    ]
+    return [to_json_ready(process_id(item)) for item in items]
 
 
 def create_from_crawl(name: str = None, endpoint: str = None,
@@ -55,7 +72,7 @@ def create_from_crawl(name: str = None, endpoint: str = None,
     url_list = [endpoint]
 
     docid = str(ContainerModel.inst_new_doc(name=name))
-    corpus = ContainerModel.inst_by_id(docid)
+    corpus = ContainerModel.inst_by_id(docid, fields=['_id'])
     corpus.set_container_type(data_from_the_web=True)
 
     depth = DEFAULT_CRAWL_DEPTH if crawl else 0
@@ -77,7 +94,7 @@ def create_from_crawl(name: str = None, endpoint: str = None,
 
 def crawl(containerid: str = None, endpoint: str = None, crawl: bool = True):
     """Launching the crawler (scrasync) on an existing corpus"""
-    corpus = ContainerModel.inst_by_id(containerid)
+    corpus = ContainerModel.inst_by_id(containerid, fields=['_id'])
     if not corpus:
         abort(404)
     set_crawl_ready(containerid, False)
@@ -118,8 +135,8 @@ def container_data(containerid):
     obj['available_feats'] = corpus.get_features_count()
     obj['name'] = corpus.get('name')
     obj['containerid'] = str(corpus.get_id())
-    obj['urls_length'] = len(corpus.get('urls'))
-    obj['texts'] = [_ for _ in corpus.get('urls')[:10]]
+    obj['urls_length'] = corpus.count_urls()
+    obj['texts'] = list(corpus.iter_urls(limit=10))
 
     return obj
 
@@ -155,7 +172,7 @@ def crawl_is_ready(containerid):
 
 def file_upload_ready(containerid):
     """Checks if hte container created from files is ready."""
-    corpus = ContainerModel.inst_by_id(containerid)
+    corpus = ContainerModel.inst_by_id(containerid, fields=['crawl_ready'])
     if not corpus:
         abort(404)
 
@@ -220,31 +237,31 @@ def delete_texts(containerid: str = None, dataids: typing.List[str] = None):
     return {'success': True, 'containerid': containerid}
 
 
-def get_text_file(containerid, dataid):
+def get_text_file(containerid, dataid, offset: int = 0, limit: int = None):
     """
-    Returns the content of a text file in the data-set.
+    Returns the content (paragraphs) of a text file in the data-set. The
+    paragraphs are paged with offset and limit.
     :param containerid:
     :param dataid:
+    :param offset:
+    :param limit:
     :return:
     """
-    container = ContainerModel.inst_by_id(containerid)
+    container = ContainerModel.inst_by_id(
+        containerid, fields=['urls', 'large_container'])
     try:
         doc = container.get_url_doc(str(dataid))
     except (RuntimeError, ):
         return abort(404, 'Requested file does not exist.')
-    fileid = doc.get('file_id')
-    txt = []
-    with open(
-            os.path.join(container.texts_path(), fileid)
-    ) as _file:
-        for _line in _file.readlines():
-            _line = _line.strip()
-            if _line:
-                txt.append(_line)
+    txt, total = read_paragraphs(
+        container.texts_path(), doc.get('file_id'), offset=offset,
+        limit=limit)
     return {
         'text': txt,
         'dataid': dataid,
         'length': len(txt),
+        'offset': offset,
+        'total': total,
         'containerid': container.get_id()
     }
 
@@ -259,7 +276,7 @@ def lemma_context(containerid, words: typing.List[str] = None):
     :param words: these are feature words (lemmatised by default)
     :return:
     """
-    container = ContainerModel.inst_by_id(containerid)
+    container = ContainerModel.inst_by_id(containerid, fields=['_id'])
     if not isinstance(words, list) or \
             not all(isinstance(_, str) for _ in words):
         raise ValueError(words)
@@ -273,17 +290,38 @@ def lemma_context(containerid, words: typing.List[str] = None):
         except StopIteration:
             matchwords.append(i)
 
-    data = celery.send_task(
-        RMXGREP_TASK['search_text'],
-        kwargs={
-            'words': matchwords,
-            'container_path': container.texts_path()
-        }).get()
+    job = search_job(container.get_id(), container.texts_path(),
+                     matchwords)
+    if not job['ready']:
+        # the query is retried once the job is ready; it is then answered
+        # from the cache of context queries.
+        return {
+            'success': False,
+            'retry': True,
+            'jobid': job['jobid'],
+            'containerid': container.get_id()
+        }
     return {
         'success': True,
         'containerid': container.get_id(),
         'data': [{'fileid': k, 'sentences': v} for k, v in
-                 data.get('data').items()]
+                 job['result'].get('data').items()]
+    }
+
+
+def features_pending(container, reqobj: dict, job: dict) -> dict:
+    """ Returned while nlp computes the features that are available; the
+        query is retried once the job is ready.
+    """
+    return {
+        'busy': True,
+        'retry': True,
+        'success': False,
+        'available': True,
+        'jobid': job['jobid'],
+        'features': reqobj.get('feats'),
+        'requested_features': reqobj.get('feats'),
+        'containerid': container.get_id()
     }
 
 
@@ -293,10 +331,13 @@ def request_features(reqobj):
     :param reqobj:
     :return:
     """
-    container = reqobj.get('container')
+    container = reqobj.get('corpus')
     del reqobj['corpus']
 
-    features, docs = container.get_features(**reqobj)
+    job = container.features_job(**reqobj)
+    if not job['ready']:
+        return features_pending(container, reqobj, job)
+    features, docs = job['result']
     return dict(
         success=True,
         features=features,
@@ -313,45 +354,14 @@ def graph(reqobj):
     container = reqobj.get('corpus')
     del reqobj['corpus']
 
-    features, docs = container.get_features(**reqobj)
-
-    links, nodes = [], []
-
-    for f in features:
-        f['id'] = uuid.uuid4().hex
-        f['group'] = f['id']
-        f['type'] = 'feature'
-        # cleanup the feat object
-        del f['docs']
-        nodes.append(f)
-
-    def get_feat(feature):
-        for item in nodes:
-            if item.get('features') == feature:
-                return item
-        return None
-    for d in docs:
-        _f = get_feat(d['features'][0]['feature'])
-        d['group'] = _f['id']
-        d['id'] = uuid.uuid4().hex
-        d['type'] = 'document'
-
-        nodes.append(d)
-        for f in d['features']:
-            if _f and f['feature'] == _f:
-                the_feat = _f
-            else:
-                the_feat = get_feat(f['feature'])
-            _f = None
-            if not the_feat:
-                continue
-            links.append(dict(
-                source=d['id'],
-                target=the_feat['id'],
-                weight=f['weight']
-            ))
-        # cleanup the doc object
-        del d['features']
+    top_k = reqobj.pop('top_k', None)
+    min_weight = reqobj.pop('min_weight', None)
+    job = container.features_job(**reqobj)
+    if not job['ready']:
+        return features_pending(container, reqobj, job)
+    features, docs = job['result']
+    nodes, links = build_graph(
+        features, docs, top_k=top_k, min_weight=min_weight)
 
     return {
         'success': True,
@@ -360,3 +370,8 @@ def graph(reqobj):
         'features': reqobj.get('feats'),
         'containerid': str(container.get_id())
     }
+
+
+def job(jobid: str):
+    """Returns a job (see core.jobs)."""
+    return jobs.status(jobid)
@@ -9,6 +9,35 @@ from ...tasks.celeryconf import RMXBOT_TASKS
 from ...tasks.container import generate_matrices_remote
 
 
+def schedule_matrices(container, feats: int = 10, words: int = 10,
+                      docs_per_feat: int = 5, feats_per_doc: int = 3) -> bool:
+    """Scheduling the computation of matrices for a number of features.
+
+       A busy status is set atomically on the container before the task is
+       sent; if another request did it already, nothing is scheduled and
+       False is returned.
+    """
+    if not container.acquire_status_feats(
+            feats=feats, task_name=RMXBOT_TASKS['generate_matrices_remote']):
+        return False
+    try:
+        celery.send_task(
+            RMXBOT_TASKS['generate_matrices_remote'],
+            kwargs={
+                'corpusid': str(container.get_id()),
+                'feats': feats,
+                'vectors_path': container.get_vectors_path(),
+                'words': words,
+                'docs_per_feat': docs_per_feat,
+                'feats_per_doc': feats_per_doc
+            }
+        )
+    except Exception:
+        container.del_status_feats(feats=feats)
+        raise
+    return True
+
+
 def check_availability(func):
 
     @wraps(func)
@@ -25,7 +54,9 @@ def check_availability(func):
         _featsperdoc = int(reqobj.get('featsperdoc', 3))
         _html = reqobj.get('html', False)
 
-        container = ContainerModel.inst_by_id(corpusid)
+        # the url objects are loaded only if features are served.
+        container = ContainerModel.inst_by_id(
+            corpusid, fields=['status', 'large_container'])
 
         availability = request_availability(corpusid, {
             'features': _features,
@@ -44,26 +75,13 @@ def check_availability(func):
                 html=_html,
                 corpus=container
             ))
-        celery.send_task(
-            RMXBOT_TASKS['generate_matrices_remote'],
-            kwargs={
-                'corpusid': str(container.get_id()),
-                'feats': _features,
-                'vectors_path': container.get_vectors_path(),
-                'words': _words,
-                'docs_per_feat': _docsperfeat,
-                'feats_per_doc': _featsperdoc
-            }
-        )
+        if not schedule_matrices(container,
+                                 feats=_features,
+                                 words=_words,
+                                 docs_per_feat=_docsperfeat,
+                                 feats_per_doc=_featsperdoc):
+            return jsonify(dict(busy=True, success=False))
 
-        # generate_matrices_remote.delay(
-        #     corpusid=str(container.get_id()),
-        #     feats=_features,
-        #     vectors_path=container.get_vectors_path(),
-        #     words=_words,
-        #     docs_per_feat=_docsperfeat,
-        #     feats_per_doc=_featsperdoc
-        # )
         out = dict(success=False, retry=True, watch=True)
         out.update(availability)
         return jsonify(out)
@@ -74,14 +92,16 @@ def check_availability(func):
 def neo_availability(func):
     """Decorator that checks if requested features have been computed. If it's
        not the case, they are generated. This decorator is used by the graphql
-       api.
+       api. Extra keyword arguments are passed to the view in the request
+       object.
     """
     @wraps(func)
     def wrapped_view(containerid: str = None, words: int = 10,
                      features: int = 10, docsperfeat: int = 5,
-                     featsperdoc: int = 3):
+                     featsperdoc: int = 3, **kwds):
 
-        container = ContainerModel.inst_by_id(containerid)
+        container = ContainerModel.inst_by_id(
+            containerid, fields=['status', 'large_container'])
 
         availability = request_availability(containerid, {
             'features': features,
@@ -98,33 +118,21 @@ def neo_availability(func):
             return out
 
         if availability.get('available'):
-            return func({
+            return func(dict(kwds, **{
                 'words': words,
                 'feats': features,
                 'docs_per_feat': docsperfeat,
                 'feats_per_doc': featsperdoc,
                 'corpus': container
-            })
+            }))
+
+        if not schedule_matrices(container,
+                                 feats=features,
+                                 words=words,
+                                 docs_per_feat=docsperfeat,
+                                 feats_per_doc=featsperdoc):
+            return out
 
-        celery.send_task(
-            RMXBOT_TASKS['generate_matrices_remote'],
-            kwargs={
-                'corpusid': str(container.get_id()),
-                'feats': features,
-                'vectors_path': container.get_vectors_path(),
-                'words': words,
-                'docs_per_feat': docsperfeat,
-                'feats_per_doc': featsperdoc
-            }
-        )
-        # generate_matrices_remote.delay(
-        #     corpusid=str(container.get_id()),
-        #     feats=features,
-        #     vectors_path=container.get_vectors_path(),
-        #     words=words,
-        #     docs_per_feat=docsperfeat,
-        #     feats_per_doc=featsperdoc
-        # )
         out.update(availability)
         return out
 
@@ -146,7 +154,8 @@ def graph_availability(func):
         docs_per_feat = reqobj.get('docs_per_feat')
         feats_per_doc = reqobj.get('feats_per_doc')
 
-        container = ContainerModel.inst_by_id(corpusid)
+        container = ContainerModel.inst_by_id(
+            corpusid, fields=['status', 'large_container'])
 
         availability = request_availability(corpusid, {
             'features': features,
@@ -164,26 +173,13 @@ def graph_availability(func):
                 feats_per_doc=feats_per_doc,
                 corpus=container
             ))
-        celery.send_task(
-            RMXBOT_TASKS['generate_matrices_remote'],
-            kwargs={
-                'corpusid': str(container.get_id()),
-                'feats': features,
-                'vectors_path': container.get_vectors_path(),
-                'words': words,
-                'docs_per_feat': docs_per_feat,
-                'feats_per_doc': feats_per_doc
-            }
-        )
+        if not schedule_matrices(container,
+                                 feats=features,
+                                 words=words,
+                                 docs_per_feat=docs_per_feat,
+                                 feats_per_doc=feats_per_doc):
+            return jsonify(dict(busy=True, success=False))
 
-        # generate_matrices_remote.delay(
-        #     corpusid=str(container.get_id()),
-        #     feats=features,
-        #     vectors_path=container.get_vectors_path(),
-        #     words=words,
-        #     docs_per_feat=docs_per_feat,
-        #     feats_per_doc=feats_per_doc
-        # )
         out = dict(success=False, retry=True, watch=True)
         out.update(availability)
         return jsonify(out)
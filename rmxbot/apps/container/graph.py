@@ -0,0 +1,67 @@
+"""Building the force-directed graph of features and documents.
+
+Features are hashed by their words, so that every document feature is mapped
+to its node in constant time; nodes and edges are built in a single pass over
+features and documents.
+"""
+import heapq
+import uuid
+
+
+def feature_key(feature: list) -> tuple:
+    """Returns the canonical key of a feature (a list of weighted words)."""
+    return tuple(_.get('word') for _ in feature)
+
+
+def build_graph(features: list, docs: list, top_k: int = None,
+                min_weight: float = None):
+    """Maps features and documents to nodes and edges.
+
+    :param features: features as returned by ContainerModel.features_job
+    :param docs: docs as returned by ContainerModel.features_job
+    :param top_k: the maximal number of edges kept for each document (the
+                  heaviest ones)
+    :param min_weight: edges lighter than min_weight are dropped
+    :return: a tuple (nodes, edges)
+    """
+    nodes, edges = [], []
+    index = {}
+
+    for f in features:
+        f['id'] = uuid.uuid4().hex
+        f['group'] = f['id']
+        f['type'] = 'feature'
+        # cleanup the feat object
+        f.pop('docs', None)
+        index[feature_key(f['features'])] = f
+        nodes.append(f)
+
+    for d in docs:
+        # cleanup the doc object
+        doc_feats = d.pop('features', None) or []
+        d['id'] = uuid.uuid4().hex
+        d['type'] = 'document'
+        # the document belongs to the group of its main feature
+        main_feat = index.get(feature_key(doc_feats[0]['feature'])) \
+            if doc_feats else None
+        d['group'] = main_feat['id'] if main_feat else None
+        nodes.append(d)
+
+        doc_edges = []
+        for f in doc_feats:
+            if min_weight is not None and f['weight'] < min_weight:
+                continue
+            the_feat = index.get(feature_key(f['feature']))
+            if not the_feat:
+                continue
+            doc_edges.append(dict(
+                source=d['id'],
+                target=the_feat['id'],
+                weight=f['weight']
+            ))
+        if top_k and len(doc_edges) > top_k:
+            doc_edges = heapq.nlargest(
+                top_k, doc_edges, key=lambda _: _['weight'])
+        edges.extend(doc_edges)
+
+    return nodes, edges
@@ -0,0 +1,83 @@
+"""Write-coalescing buffer for the url objects created while crawling.
+
+Every page saved by the crawler produces a url object. Instead of one update
+of the container per page, url objects are accumulated in a redis list per
+container and written with a single update, when the buffer is full, when its
+oldest object is too old, or when the crawl is over.
+"""
+import json
+import time
+
+import bson
+
+from ...config import URLOBJ_BUFFER_SECONDS, URLOBJ_BUFFER_SIZE
+from ...contrib.db.redis_connection import get_redis
+from .models import DataObject, insert_urlobjs
+
+_PREFIX = 'rmxbot:urlobj-buffer'
+
+
+def _keys(containerid):
+    """Returns the key of the buffer and the key holding the time at which the
+       oldest object was buffered.
+    """
+    containerid = str(containerid)
+    return f'{_PREFIX}:{containerid}', f'{_PREFIX}:{containerid}:since'
+
+
+def buffer_urlobj(containerid: (str, bson.ObjectId) = None,
+                  url_obj: dict = None):
+    """Validating and buffering a url object; the buffer is flushed when it
+       reaches its size or time bound.
+    """
+    DataObject.simple_validation(url_obj)
+    key, since_key = _keys(containerid)
+
+    pipe = get_redis().pipeline()
+    pipe.rpush(key, json.dumps(url_obj))
+    pipe.set(since_key, time.time(), nx=True)
+    pipe.get(since_key)
+    length, _, since = pipe.execute()
+
+    if length >= URLOBJ_BUFFER_SIZE or \
+            time.time() - float(since or 0) >= URLOBJ_BUFFER_SECONDS:
+        return flush(containerid)
+    return 0
+
+
+def flush(containerid: (str, bson.ObjectId) = None) -> int:
+    """Writing all buffered url objects to the container. Returns the number
+       of objects written.
+    """
+    key, since_key = _keys(containerid)
+    conn = get_redis()
+
+    # taking the buffer atomically; objects buffered from here on go to a new
+    # list.
+    pipe = conn.pipeline(transaction=True)
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key, since_key)
+    items, _ = pipe.execute()
+    if not items:
+        return 0
+
+    try:
+        insert_urlobjs(containerid, [json.loads(_) for _ in items])
+    except Exception:
+        # putting the objects back, so that these are written on next flush.
+        conn.rpush(key, *items)
+        conn.set(since_key, time.time(), nx=True)
+        raise
+    return len(items)
+
+
+def flush_stale(containerid: (str, bson.ObjectId) = None) -> int:
+    """Flushing the buffer if its oldest object is older than the time bound.
+       This is called while the crawl is monitored, as the buffer is only
+       checked when objects are added.
+    """
+    _, since_key = _keys(containerid)
+    since = get_redis().get(since_key)
+    if since and time.time() - float(since) >= URLOBJ_BUFFER_SECONDS:
+        return flush(containerid)
+    return 0
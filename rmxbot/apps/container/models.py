@@ -1,8 +1,6 @@
 
 import datetime
-import json
 import os
-import re
 import stat
 from typing import List
 
@@ -10,14 +8,50 @@ import bson
 import pymongo
 
 from ...app import celery
-from ...config import CORPUS_COLL, CORPUS_ROOT, MATRIX_FOLDER, TEXT_FOLDER
+from ...config import (CORPUS_COLL, CORPUS_ROOT, FEATURES_CACHE_REDIS_SIZE,
+                       FEATURES_CACHE_SIZE, FEATURES_CACHE_TTL, INDEX_FOLDER,
+                       LARGE_CONTAINERS, MATRIX_FOLDER, SEGMENTS_FOLDER,
+                       TEXT_FOLDER, TEXT_STORE)
 from ...contrib.db.connection import get_collection
 from ...contrib.db.models.document import Document
-from ...core.matrix_files import get_available_features
-from ...tasks.celeryconf import NLP_TASKS
+from ...core import jobs
+from ...core.cache import ResultCache
+from ...core.lemma_index import lemma_words
+from ...core.matrix_files import features_version, get_available_features
+from ...tasks.celeryconf import NLP_TASKS, RMXBOT_TASKS
+from . import urlobjects
 
 _COLLECTION = get_collection(collection=CORPUS_COLL)
 
+# projection used when listing containers
+LIST_PROJECTION = {
+    'urls': {'$slice': 10},
+    'name': 1,
+    'description': 1,
+    'created': 1,
+    'screenplay': 1,
+    'large_container': 1
+}
+
+INDEXES_CREATED = False
+
+# features and docs, as returned by ContainerModel.prepare_features
+FEATURES_CACHE = ResultCache('features',
+                             maxsize=FEATURES_CACHE_SIZE,
+                             redis_maxsize=FEATURES_CACHE_REDIS_SIZE,
+                             ttl=FEATURES_CACHE_TTL)
+
+
+def ensure_indexes():
+    """Creating the indexes on the collection, once per process."""
+    global INDEXES_CREATED
+    if not INDEXES_CREATED:
+        # listing of containers (keyset pagination)
+        _COLLECTION.create_index([('crawl_ready', pymongo.ASCENDING),
+                                  ('created', pymongo.DESCENDING),
+                                  ('_id', pymongo.DESCENDING)])
+        INDEXES_CREATED = True
+
 
 class DataObject(Document):
     """Class mapping the urls in the container to their original Data objects.
@@ -103,6 +137,9 @@ class ContainerModel(Document):
 
         'expected_files': list,
 
+        # url objects are stored in their own collection (see urlobjects)
+        'large_container': bool,
+
     }
     required_fields = ['created']
 
@@ -127,7 +164,11 @@ class ContainerModel(Document):
             'data_from_files': False,
             'data_from_the_web': False,
 
+            'large_container': False,
+
         }
+        # lazily built mapping of data ids and file ids to url objects.
+        self._url_index = None
         super().__init__(*args, **kwds)
 
     @classmethod
@@ -138,6 +179,8 @@ class ContainerModel(Document):
         if 'screenplay' in kwds and kwds.get('screenplay'):
             _doc['screenplay'] = True
 
+        _doc['large_container'] = kwds.get('large_container', LARGE_CONTAINERS)
+
         if save:
             docid = _doc.save()
             _doc.create_folder()
@@ -152,12 +195,7 @@ class ContainerModel(Document):
            list of urls.
         """
         if not projection:
-            projection = {
-                'urls': {'$slice': 10},
-                'name': 1,
-                'description': 1,
-                'created': 1
-            }
+            projection = LIST_PROJECTION
         return super().range_query(
             projection=projection,
             start=start,
@@ -165,8 +203,77 @@ class ContainerModel(Document):
             limit=limit,
             direct=direction)
 
+    @classmethod
+    def keyset_query(cls, projection=None, after: str = None, limit=100,
+                     direction=pymongo.DESCENDING, query={}):
+        """Overriding document's keyset_query method in order to get a sliced
+           list of urls.
+        """
+        ensure_indexes()
+        return super().keyset_query(
+            projection=projection or LIST_PROJECTION,
+            after=after,
+            query=query,
+            limit=limit,
+            direct=direction)
+
+    @property
+    def is_large(self) -> bool:
+        """True if the url objects are kept in the urls collection."""
+        return bool(self.get('large_container'))
+
     def get_dataids(self):
-        return [bson.ObjectId(_.get('data_id')) for _ in self.get('urls')]
+        return [bson.ObjectId(_.get('data_id')) for _ in self.iter_urls(
+            projection={'_id': 0, 'data_id': 1})]
+
+    def iter_urls(self, limit: int = 0, projection: dict = None):
+        """Iterates over the url objects of the container."""
+        if self.is_large:
+            return urlobjects.find(
+                self.get_id(), projection=projection, limit=limit)
+        urls = self.get('urls') or []
+        return iter(urls[:limit] if limit else urls)
+
+    def count_urls(self) -> int:
+        """Returns the number of url objects in the container."""
+        if self.is_large:
+            return urlobjects.count(self.get_id())
+        return len(self.get('urls') or [])
+
+    def migrate_urls(self):
+        """Moving the embedded url objects to the urls collection.
+
+           The container is flagged first, so that url objects inserted
+           during the migration go to the collection; the copy is idempotent.
+           Only the url objects that were copied are pulled from the
+           container (as they were read), and the list is read again until
+           it is empty, so that url objects pushed by writers that did not
+           see the flag are kept; the list is removed only while it is
+           empty.
+        """
+        if self.is_large:
+            return False
+        _COLLECTION.update_one({'_id': self.get_id()},
+                               {'$set': {'large_container': True}})
+        while True:
+            doc = _COLLECTION.find_one({'_id': self.get_id()}, {'urls': 1})
+            urls = doc.get('urls') or []
+            if not urls:
+                result = _COLLECTION.update_one(
+                    {'_id': self.get_id(), 'urls': {'$in': [[], None]}},
+                    {'$unset': {'urls': ''}})
+                if result.matched_count or 'urls' not in doc:
+                    break
+                # a url object was pushed after the list was read
+                continue
+            for idx in range(0, len(urls), 1000):
+                urlobjects.upsert_many(self.get_id(), urls[idx:idx + 1000])
+            _COLLECTION.update_one({'_id': self.get_id()},
+                                   {'$pullAll': {'urls': urls}})
+        self['large_container'] = True
+        self['urls'] = []
+        self._url_index = None
+        return True
 
     def get_folder_path(self):
         """ Returns the path to the container directory. """
@@ -204,16 +311,13 @@ class ContainerModel(Document):
 
     def get_lemma_words(self, lemma: (str, list) = None):
         """For a list of lemma, returns all the words that can be found in
-           texts.
+           texts. These are looked up in the lemma index.
         """
         lemma_list = lemma.split(',') if isinstance(lemma, str) else lemma
-        if not all(isinstance(_, str) for _ in lemma):
+        if not all(isinstance(_, str) for _ in lemma_list):
             raise ValueError(lemma)
-        pattern = r"""(\{.*(%s).*\})""" % '|'.join(lemma_list)
-        with open(self.get_lemma_path(), 'r') as _file:
-            content = _file.read()
-            dicts = [_[0] for _ in re.findall(pattern, content)]
-            return map(json.loads, dicts), lemma_list
+        self.get_lemma_path()
+        return lemma_words(self.matrix_path, lemma_list), lemma_list
 
     def texts_path(self):
         """ Returns the path that will contain the files that make the
@@ -233,25 +337,31 @@ class ContainerModel(Document):
         if not os.path.isdir(path):
             os.makedirs(path, exist_ok=False)
             os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-        for _path in [os.path.join(path, MATRIX_FOLDER),
-                      os.path.join(path, TEXT_FOLDER)]:
+        folders = [MATRIX_FOLDER, TEXT_FOLDER, INDEX_FOLDER]
+        if TEXT_STORE == 'segments':
+            folders.append(SEGMENTS_FOLDER)
+        for _path in [os.path.join(path, _) for _ in folders]:
             if not os.path.isdir(_path):
                 os.makedirs(_path, exist_ok=False)
                 os.chmod(_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
 
         return path
 
-    def get_features(self,
-                     feats: int = 10,
-                     words: int = 6,
-                     docs_per_feat: int = 0,
-                     feats_per_doc: int = 3,
-                     **_):
-        """ Getting the features from nlp. This will call a view method that
-            will retrieve or generate the requested data.
+    def features_key(self, feats: int = 10, words: int = 6,
+                     docs_per_feat: int = 0, feats_per_doc: int = 3) -> str:
+        """ The key of features and docs in FEATURES_CACHE; it changes with
+            the matrices.
         """
-
-        features, docs = celery.send_task(
+        return ':'.join(str(_) for _ in (
+            self.get_id(),
+            features_version(
+                str(self.get_id()), self.get_folder_path(), feats),
+            feats, words, docs_per_feat, feats_per_doc))
+
+    def features_signature(self, feats: int = 10, words: int = 6,
+                           docs_per_feat: int = 0, feats_per_doc: int = 3):
+        """ The signature of the nlp task returning features and docs. """
+        return celery.signature(
             NLP_TASKS['features_and_docs'], kwargs={
                 'path': self.get_folder_path(),
                 'feats': feats,
@@ -260,8 +370,12 @@ class ContainerModel(Document):
                 'docs_per_feat': docs_per_feat,
                 'feats_per_doc': feats_per_doc
             }
-        ).get()
+        )
 
+    def prepare_features(self, features, docs):
+        """ Sorting the features returned by nlp and mapping features and
+            docs to url objects.
+        """
         features = sorted(
             features,
             key=lambda _: _.get('features')[0].get('weight'),
@@ -269,6 +383,31 @@ class ContainerModel(Document):
         )
         return self.features_to_json(features), self.docs_to_json(docs)
 
+    def features_job(self,
+                     feats: int = 10,
+                     words: int = 6,
+                     docs_per_feat: int = 0,
+                     feats_per_doc: int = 3,
+                     **_) -> dict:
+        """ Returns a job for the features and docs (see core.jobs). Unless
+            these are cached, nlp is called and the enrich_features task
+            caches the result; results are cached until the matrices change.
+        """
+        params = dict(feats=feats, words=words, docs_per_feat=docs_per_feat,
+                      feats_per_doc=feats_per_doc)
+        cache_key = self.features_key(**params)
+        cached = FEATURES_CACHE.get(cache_key)
+        if cached is not None:
+            return jobs.done(cached)
+        return jobs.submit(
+            self.features_signature(**params) | celery.signature(
+                RMXBOT_TASKS['enrich_features'], kwargs={
+                    'containerid': str(self.get_id()),
+                    'cache_key': cache_key
+                }),
+            key=f'features:{cache_key}'
+        )
+
     def get_status_feats(self, feats: int = None):
 
         try:
@@ -277,18 +416,33 @@ class ContainerModel(Document):
         except StopIteration:
             return None
 
-    def set_status_feats(self, feats: int = None, busy: bool = True, **kwds):
+    def acquire_status_feats(self, feats: int = None, busy: bool = True,
+                             **kwds) -> bool:
+        """ Atomically adding a busy status for a number of features. Returns
+            True if the status was added by this call, False if a status for
+            feats exists already; this ensures that only one computation is
+            scheduled per container and feats.
+        """
+        res = _COLLECTION.update_one({
+            '_id': self.get('_id'),
+            'status.feats': {'$ne': feats}
+        }, {
+            '$push': {
+                'status': ContainerStatus(busy=busy, feats=feats, **kwds)
+            }
+        })
+        return res.modified_count == 1
 
-        if self.get_status_feats(feats=feats):
+    def set_status_feats(self, feats: int = None, busy: bool = True, **kwds):
 
+        if self.acquire_status_feats(feats=feats, busy=busy, **kwds):
             return True
-        return _COLLECTION.update({'_id': self.get('_id')}, {
-            '$push': {'status': ContainerStatus(
-                busy=busy,
-                feats=feats,
-                **kwds
-            )}
-        })
+        # the status exists - it was set when the task was scheduled.
+        kwds['updated'] = datetime.datetime.now()
+        return _COLLECTION.update_one(
+            {'_id': self.get('_id'), 'status.feats': feats},
+            {'$set': {'status.$.{}'.format(k): v for k, v in kwds.items()}}
+        )
 
     def del_status_feats(self, feats: int = None):
         # todo(): view this method and delete
@@ -349,21 +503,56 @@ class ContainerModel(Document):
         else:
             return sorted([int(_.get('featcount')) for _ in avl])
 
+    @property
+    def url_index(self) -> dict:
+        """Mapping of data ids and file ids to url objects. The index is built
+           once per instance, on first access.
+        """
+        if self._url_index is None:
+            self._url_index = index_url_objects(self.iter_urls())
+        return self._url_index
+
     def get_url_doc(self, docid):
         """ Get the url doc for id. """
+        if self.is_large:
+            index = self.get_url_docs([docid])
+        else:
+            index = self.url_index
         try:
-            return next(
-                _ for _ in self.get('urls')
-                if _.get('data_id') == docid or _.get('file_id') == docid
-            )
-        except StopIteration:
+            return index[docid]
+        except KeyError:
             raise RuntimeError(docid)
 
+    def get_url_docs(self, docids: List[str]) -> dict:
+        """ Bulk lookup of url docs. Returns a mapping of the requested ids
+            to their url objects; ids that are not in the container are
+            omitted.
+        """
+        if self.is_large:
+            # only the requested url objects are loaded from the collection;
+            # these are kept in the instance's index.
+            if self._url_index is None:
+                self._url_index = {}
+            index = self._url_index
+            missing = [_ for _ in docids if _ not in index]
+            if missing:
+                index_url_objects(
+                    urlobjects.find_by_ids(self.get_id(), missing), index)
+        else:
+            index = self.url_index
+        return {_id: index[_id] for _id in docids if _id in index}
+
     def features_to_json(self, features):
         """ Mapping a list of given docs to feature's doc. """
+        url_docs = self.get_url_docs(
+            [_doc.get('dataid') for _ftr in features
+             for _doc in _ftr.get('docs')])
         for _ftr in features:
             for _doc in _ftr.get('docs'):
-                _ = self.get_url_doc(_doc.get('dataid'))
+                try:
+                    _ = url_docs[_doc.get('dataid')]
+                except KeyError:
+                    raise RuntimeError(_doc.get('dataid'))
                 _doc['title'] = _.get('title')
                 _doc['url'] = _.get('url')
         return features
@@ -371,8 +560,12 @@ class ContainerModel(Document):
     def docs_to_json(self, docs):
         """
         """
+        url_docs = self.get_url_docs([doc.get('dataid') for doc in docs])
         for doc in docs:
-            url_obj = self.get_url_doc(doc.get('dataid'))
+            try:
+                url_obj = url_docs[doc.get('dataid')]
+            except KeyError:
+                raise RuntimeError(doc.get('dataid'))
             doc['url'] = url_obj.get('url')
             doc['title'] = url_obj.get('title')
             doc['fileid'] = url_obj.get('file_id')
@@ -390,7 +583,7 @@ class ContainerModel(Document):
         _COLLECTION.update_one({'_id': bson.ObjectId(containerid)}, {
             '$pull': {'expected_files': {'unique_id': unique_file_id}}
         })
-        doc = cls.inst_by_id(containerid)
+        doc = cls.inst_by_id(containerid, fields=['expected_files'])
         return doc
 
     @classmethod
@@ -442,14 +635,17 @@ class ContainerModel(Document):
 
     def dataid_fileid(self, data_ids: List[str] = None) -> List[tuple]:
         """Returns a mapping between data ids and file ids."""
+        url_docs = self.get_url_docs(data_ids)
         return [(_.get('data_id'), _.get('file_id'),)
-                for _ in self.get('urls') if _.get('data_id') in data_ids]
+                for _ in url_docs.values()]
 
     def del_data_objects(self, data_ids: List[str] = None):
         """Deleting data objects from the urls list.
         :param data_ids:
         :return:
         """
+        if self.is_large:
+            return urlobjects.delete(self.get_id(), data_ids)
         return _COLLECTION.update_one(
             {'_id': self.get_id()},
             {'$pull': {
@@ -462,20 +658,54 @@ class ContainerModel(Document):
         )
 
 
+def index_url_objects(url_objs, index: dict = None) -> dict:
+    """Maps data ids and file ids to their url objects."""
+    index = {} if index is None else index
+    for _obj in url_objs:
+        if _obj.get('data_id'):
+            index[_obj.get('data_id')] = _obj
+        if _obj.get('file_id'):
+            index[_obj.get('file_id')] = _obj
+    return index
+
+
 def insert_urlobj(containerid: (str, bson.ObjectId) = None,
                   url_obj: dict = None):
     """ Validating the url object and inserting it in the container list of urls.
     """
-    DataObject.simple_validation(url_obj)
+    return insert_urlobjs(containerid, [url_obj])
+
+
+def insert_urlobjs(containerid: (str, bson.ObjectId) = None,
+                   url_objs: List[dict] = None):
+    """ Validating url objects and inserting these in the container with a
+        single write.
+    """
+    for url_obj in url_objs:
+        DataObject.simple_validation(url_obj)
 
     containerid = bson.ObjectId(containerid)
-    _COLLECTION.update_one(
-        {'_id': containerid},
-        {'$push': {'urls': url_obj}}
-    )
+    if not url_objs:
+        return containerid
+    if is_large_container(containerid):
+        urlobjects.insert_many(containerid, url_objs)
+    else:
+        _COLLECTION.update_one(
+            {'_id': containerid},
+            {'$push': {'urls': {'$each': url_objs}}}
+        )
     return containerid
 
 
+def is_large_container(containerid) -> bool:
+    """Checks if the container keeps its url objects in their own
+       collection.
+    """
+    doc = _COLLECTION.find_one(
+        {'_id': bson.ObjectId(containerid)}, {'large_container': 1})
+    return bool(doc and doc.get('large_container'))
+
+
 def set_crawl_ready(containerid, value):
     """ Set the value of crawl_ready on the container. """
     _id = bson.ObjectId(containerid)
@@ -531,7 +761,8 @@ def request_availability(containerid, reqobj: dict, container=None):
         if not isinstance(v, structure.get(k)):
             raise ValueError(reqobj)
 
-    container = container or ContainerModel.inst_by_id(containerid)
+    container = container or ContainerModel.inst_by_id(
+        containerid, fields=['status'])
 
     availability = container.features_availability(
         feature_number=reqobj['features'])
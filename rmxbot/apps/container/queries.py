@@ -40,6 +40,9 @@ class ContainerStructure(graphene.ObjectType):
     data_from_files = graphene.Boolean()
     data_from_the_web = graphene.Boolean()
 
+    # opaque cursor; passed as 'after' to paginate, it returns the next page.
+    cursor = graphene.String()
+
 
 class ContainerData(graphene.ObjectType):
     """
@@ -170,26 +173,37 @@ class FeatureContext(graphene.ObjectType):
           fileid
         }
         success
+        retry
+        jobid
       }
     }
     ```
+    While rmxgrep searches the texts, success is false and retry is true; the
+    query is repeated once the job is ready (see the job query), and is then
+    answered from the cache of context queries, for CONTEXT_CACHE_TTL
+    seconds.
     """
     containerid = graphene.String()
     success = graphene.Boolean()
+    retry = graphene.Boolean()
+    jobid = graphene.String()
     data = graphene.List(ContextPhrase)
 
 
 class FileText(graphene.ObjectType):
     """
-    For a given containerid and dataid, returns all sentences that are contained
-    in the file.
+    For a given containerid and dataid, returns the paragraphs that are
+    contained in the file; these are paged with offset and limit.
     Graphql query:
     ```
     query {
-      fileText(containerid:"<CONTAINER-ID>", dataid:"<DATA-ID>"){
+      fileText(containerid:"<CONTAINER-ID>", dataid:"<DATA-ID>",
+               offset:0, limit:50){
         dataid
         containerid
         length
+        offset
+        total
         text
       }
     }
@@ -198,7 +212,11 @@ class FileText(graphene.ObjectType):
     containerid = graphene.String()
     dataid = graphene.String()
     text = graphene.List(graphene.String)
+    # the number of paragraphs returned
     length = graphene.Int()
+    offset = graphene.Int()
+    # the number of paragraphs in the file
+    total = graphene.Int()
 
 
 class Word(graphene.ObjectType):
@@ -291,6 +309,8 @@ class Features(graphene.ObjectType):
     retry = graphene.Boolean()
     watch = graphene.Boolean()
     success = graphene.Boolean()
+    # the job computing the features, if these are available but not cached
+    jobid = graphene.String()
 
     features = graphene.List(FeaturesWithDocs)
     docs = graphene.List(Doc)
@@ -355,7 +375,9 @@ class GraphInterface(graphene.Interface):
             features:12,
             docsperfeat:3,
             featsperdoc:5,
-            words:20
+            words:20,
+            topk:3,
+            minweight:0.01
         ) {
           containerid
           success
@@ -433,6 +455,34 @@ class GraphGenerate(graphene.ObjectType):
     busy = graphene.Boolean()
     retry = graphene.Boolean()
     available = graphene.Boolean()
+    jobid = graphene.String()
+
+
+class Job(graphene.ObjectType):
+    """
+    A job started by a query or a view (see core.jobs); the result is set
+    once the job succeeds.
+
+    Graphql query:
+    ```
+    query {
+      job(jobid:"<JOB-ID>") {
+        jobid
+        state
+        ready
+        success
+        result
+        error
+      }
+    }
+    ```
+    """
+    jobid = graphene.String()
+    state = graphene.String()
+    ready = graphene.Boolean()
+    success = graphene.Boolean()
+    result = graphene.JSONString()
+    error = graphene.String()
 
 
 class Query(graphene.AbstractType):
@@ -445,8 +495,9 @@ class Query(graphene.AbstractType):
 
     paginate = graphene.List(
         ContainerStructure,
-        start=graphene.Int(),
-        limit=graphene.Int()
+        start=graphene.Int(default_value=0),
+        limit=graphene.Int(default_value=100),
+        after=graphene.String()
     )
 
     container_ready = graphene.Field(
@@ -471,7 +522,9 @@ class Query(graphene.AbstractType):
     file_text = graphene.Field(
         FileText,
         containerid=graphene.String(),
-        dataid=graphene.String()
+        dataid=graphene.String(),
+        offset=graphene.Int(default_value=0),
+        limit=graphene.Int()
     )
 
     features = graphene.Field(
@@ -489,9 +542,13 @@ class Query(graphene.AbstractType):
         words=graphene.Int(default_value=10),
         features=graphene.Int(default_value=10),
         docsperfeat=graphene.Int(default_value=5),
-        featsperdoc=graphene.Int(default_value=3)
+        featsperdoc=graphene.Int(default_value=3),
+        topk=graphene.Int(),
+        minweight=graphene.Float()
     )
 
+    job = graphene.Field(Job, jobid=graphene.String(required=True))
+
     def resolve_container_data(parent, info, containerid):
         """
         Retrieve data that summarise a corpus/crawl
@@ -501,15 +558,17 @@ class Query(graphene.AbstractType):
         """
         return data.container_data(containerid)
 
-    def resolve_paginate(parent, info, start, limit):
+    def resolve_paginate(parent, info, start, limit, after=None):
         """
         Paginates the datasets, retrieving a limited number of field for each
-        corpus.
+        corpus. The next page is requested with the cursor of the last item
+        passed as 'after'.
 
         This is the query:
         ```
-        query{paginate(start:0, limit:100){
+        query{paginate(limit:100, after:"<CURSOR>"){
           containerid
+          cursor
           description
           name
           urls{
@@ -524,9 +583,10 @@ class Query(graphene.AbstractType):
         :param info:
         :param start:
         :param limit:
+        :param after:
         :return:
         """
-        return data.paginate(start=start, limit=limit)
+        return data.paginate(start=start, limit=limit, after=after)
 
     def resolve_container_ready(parent, info, containerid, feats):
 
@@ -582,9 +642,11 @@ class Query(graphene.AbstractType):
         """
         return data.lemma_context(containerid=containerid, words=words)
 
-    def resolve_file_text(parent, info, containerid, dataid):
+    def resolve_file_text(parent, info, containerid, dataid, offset,
+                          limit=None):
 
-        return data.get_text_file(containerid=containerid, dataid=dataid)
+        return data.get_text_file(containerid=containerid, dataid=dataid,
+                                  offset=offset, limit=limit)
 
     def resolve_features(parent, info, containerid, words, features, docsperfeat,
                          featsperdoc):
@@ -609,12 +671,22 @@ class Query(graphene.AbstractType):
         )
 
     def resolve_graph(parent, info, containerid, words, features, docsperfeat,
-                      featsperdoc):
-
+                      featsperdoc, topk=None, minweight=None):
+        """
+        Retrieves the nodes and edges of the graph. The edges of each document
+        can be pruned to the 'topk' heaviest ones and to those weighing at
+        least 'minweight'.
+        """
         return data.graph(
             containerid=containerid,
             words=words,
             features=features,
             docsperfeat=docsperfeat,
-            featsperdoc=featsperdoc
+            featsperdoc=featsperdoc,
+            top_k=topk,
+            min_weight=minweight
         )
+
+    def resolve_job(parent, info, jobid):
+        """Returns the state of a job and its result, once it is ready."""
+        return data.job(jobid)
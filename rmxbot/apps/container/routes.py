@@ -1,30 +1,33 @@
 """ Routes for the corpus module. """
-import json
-import os
 import time
-import uuid
 from urllib.parse import urlencode
 
 import bson
 from flask import (abort, Blueprint, jsonify, redirect, render_template,
-                   request)
+                   request, Response)
 import pymongo
-import requests
 
 from ...app import celery
 from ...config import (DEFAULT_CRAWL_DEPTH, EXTRACTXT_FILES_UPLOAD_URL,
-                       TEMPLATES)
-from ...contrib.rmxjson import RmxEncoder
+                       NEAR_DUP_THRESHOLD, TEMPLATES)
+from ...contrib.db.models.document import encode_cursor
+from ...contrib.rmxjson import dumps
+from ...core import jobs, neardup, rpc
+from ...core.context_index import search_job
+from ...core.text_index import read_paragraphs
 from ..data.models import (
     DataModel, LIST_SCREENPLAYS_PROJECT, LISTURLS_PROJECT)
 from .decorators import check_availability
+from .graph import build_graph
 from .models import (ContainerModel, container_status, request_availability,
                      set_crawl_ready)
 from .status import status_text
-from ...tasks.celeryconf import (NLP_TASKS, RMXCLUSTER_TASKS, RMXBOT_TASKS,
-                                 RMXGREP_TASK, SCRASYNC_TASKS)
+from . import urlobjects
+from ...tasks.celeryconf import NLP_TASKS, RMXBOT_TASKS, SCRASYNC_TASKS
 from ...tasks.container import (crawl_async, delete_data_from_container, test_task)
 
+HOME_PAGE_SIZE = 100
+
 ERR_MSGS = dict(
     container_does_not_exist='A container with id: "{}" does not exist.')
 
@@ -34,29 +37,46 @@ container_app = Blueprint(
 
 @container_app.route('/')
 def container_home():
-    """ Renders the home page for the corpus.
+    """ Renders the home page for the corpus. Pages are requested with the
+        'after' cursor of the previous page.
     :return:
     """
     context = {}
-    cursor = ContainerModel.range_query(
-        query={'crawl_ready': True},
-        projection=dict(),
-        direction=pymongo.DESCENDING)
-    encoder = RmxEncoder()
-    out = []
-    for item in cursor:
-        item = json.loads(encoder.encode(item))
+    try:
+        cursor = ContainerModel.keyset_query(
+            query={'crawl_ready': True},
+            after=request.args.get('after'),
+            limit=HOME_PAGE_SIZE,
+            direction=pymongo.DESCENDING)
+    except ValueError:
+        abort(400)
+    out = list(cursor)
+    if len(out) == HOME_PAGE_SIZE:
+        context['after'] = encode_cursor(out[-1])
+
+    # url objects of large containers, with one query
+    first_urls = urlobjects.first_urls(
+        [_['_id'] for _ in out if _.get('large_container')])
+    # screenplay data for all containers on the page, with one query
+    data_ids = {}
+    for item in out:
+        if item['_id'] in first_urls:
+            item['urls'] = first_urls[item['_id']]
         if item.get('screenplay', False):
-            item['data'] = DataModel.query_data_project(
-                query={'_id': {
-                    '$in': [bson.ObjectId(_.get('data_id'))
-                            for _ in item.get('urls')][:10]
-                }},
-                project=LIST_SCREENPLAYS_PROJECT
-            )
-        item['corpusid'] = item['_id']
-        del item['_id']
-        out.append(item)
+            data_ids[item['_id']] = [
+                bson.ObjectId(_.get('data_id'))
+                for _ in item.get('urls') or []][:10]
+    if data_ids:
+        data = DataModel.query_data_project(
+            query={'_id': {'$in': [_ for ids in data_ids.values()
+                                   for _ in ids]}},
+            project=LIST_SCREENPLAYS_PROJECT
+        )
+    for item in out:
+        if item['_id'] in data_ids:
+            ids = set(data_ids[item['_id']])
+            item['data'] = [_ for _ in data if _.get('id') in ids]
+        item['corpusid'] = str(item.pop('_id'))
 
     context['data'] = out
     return render_template("corpus/index.html", **context)
@@ -86,7 +106,7 @@ def create_from_crawl():
     crawl = True if crawl else crawl
 
     docid = str(ContainerModel.inst_new_doc(name=the_name))
-    corpus = ContainerModel.inst_by_id(docid)
+    corpus = ContainerModel.inst_by_id(docid, fields=['_id'])
     corpus.set_container_type(data_from_the_web=True)
 
     depth = DEFAULT_CRAWL_DEPTH if crawl else 0
@@ -116,7 +136,7 @@ def crawl():
     crawl = request.form.get("crawl", True)
     crawl = True if crawl else crawl
 
-    if not ContainerModel.inst_by_id(corpusid):
+    if not ContainerModel.inst_by_id(corpusid, fields=['_id']):
         abort(404)
 
     set_crawl_ready(corpusid, False)
@@ -141,14 +161,32 @@ def crawl():
 def view_test_task(a, b):
 
     # res = test_task.delay(int(a), int(b))
-    res = celery.send_task(
-        RMXBOT_TASKS['test_task'],
-        kwargs={
-            'a': int(a),
-            'b': int(b)
-        }
-    ).get()
-    return jsonify({'success': True, 'result': res})
+    job = jobs.send(RMXBOT_TASKS['test_task'], a=int(a), b=int(b))
+    return jsonify(dict(job, success=True))
+
+
+@container_app.errorhandler(rpc.Error)
+def rpc_error(err):
+    """ A remote worker did not answer in time or is unavailable. """
+    return jsonify({
+        'success': False,
+        'retry': not isinstance(err, rpc.RemoteError),
+        'error': err.__class__.__name__
+    }), 503
+
+
+@container_app.route('/rpc-stats/')
+def rpc_stats():
+    """ Returns the latency and failures of the calls to remote workers. """
+    return jsonify(rpc.stats())
+
+
+@container_app.route('/job/<jobid>/')
+def job_status(jobid):
+    """ Returns the state of a job and its result, once it is ready. Jobs are
+        returned by the views that call remote workers (see core.jobs).
+    """
+    return Response(dumps(jobs.status(jobid)), mimetype='application/json')
 
 
 @container_app.route('/<objectid:corpusid>/', methods=['GET'])
@@ -170,8 +208,8 @@ def corpus_data_view(corpusid):
     context['available_feats'] = corpus.get_features_count()
     context['corpus_name'] = corpus.get('name')
     context['corpusid'] = str(corpus.get_id())
-    context['urls_length'] = len(corpus.get('urls'))
-    context['texts'] = [_ for _ in corpus.get('urls')[:10]]
+    context['urls_length'] = corpus.count_urls()
+    context['texts'] = list(corpus.iter_urls(limit=10))
 
     return render_template("corpus/data.html", **context)
 
@@ -210,7 +248,7 @@ def corpus_crawl_ready(corpusid):
                      methods=['GET'])
 def corpus_from_files_ready(corpusid):
 
-    corpus = ContainerModel.inst_by_id(corpusid)
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['crawl_ready'])
     if not corpus:
         abort(404)
 
@@ -317,30 +355,36 @@ def delete_texts(corpusid):
 @container_app.route('/<objectid:corpusid>/file/<objectid:dataid>/',
                      methods=['GET'])
 def get_text_file(corpusid, dataid):
-
-    corpus = ContainerModel.inst_by_id(corpusid)
+    """ Returns the paragraphs of a text file; these are paged with the
+        'offset' and 'limit' parameters.
+    """
+    corpus = ContainerModel.inst_by_id(
+        corpusid, fields=['urls', 'large_container'])
     try:
         doc = corpus.get_url_doc(str(dataid))
     except (RuntimeError, ):
         return abort(404, 'Requested file does not exist.')
-    fileid = doc.get('file_id')
-    txt = []
-    with open(
-            os.path.join(corpus.texts_path(), fileid)
-    ) as _file:
-        # _file.readline()
-        # while True:
-        #     _ = _file.readline()
-        #     if not _.strip():
-        #         continue
-        #     else:
-        #         txt += _
-        #         break
-        for _line in _file.readlines():
-            _line = _line.strip()
-            if _line:
-                txt.append(_line)
-    return jsonify({'text': txt, 'dataid': dataid, 'length': len(txt)})
+    offset = request.args.get('offset', 0, type=int)
+    txt, total = read_paragraphs(
+        corpus.texts_path(), doc.get('file_id'),
+        offset=offset,
+        limit=request.args.get('limit', type=int))
+    return jsonify({'text': txt, 'dataid': dataid, 'length': len(txt),
+                    'offset': offset, 'total': total})
+
+
+@container_app.route('/<objectid:corpusid>/suppressed/')
+def suppressed_texts(corpusid):
+    """ Returns the texts that were not added to the container, because
+        these are near-duplicates of its texts.
+    """
+    return Response(dumps({
+        'success': True,
+        'containerid': str(corpusid),
+        'threshold': NEAR_DUP_THRESHOLD,
+        'data': list(neardup.suppressed(
+            corpusid, limit=request.args.get('limit', 1000, type=int)))
+    }), mimetype='application/json')
 
 
 @container_app.route('/<objectid:corpusid>/context/')
@@ -350,7 +394,7 @@ def lemma_context(corpusid):
     :param corpusid:
     :return:
     """
-    corpus = ContainerModel.inst_by_id(corpusid)
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
     lemma_to_words, lemma = corpus.get_lemma_words(request.args.get('lemma'))
 
     matchwords = []
@@ -361,19 +405,25 @@ def lemma_context(corpusid):
         except StopIteration:
             matchwords.append(i)
 
-    data = celery.send_task(
-        RMXGREP_TASK['search_text'],
-        kwargs={
-            'highlight': True,
-            'words': matchwords,
-            'container_path': corpus.texts_path()
-        }).get()
+    job = search_job(corpus.get_id(), corpus.texts_path(), matchwords,
+                     highlight=True)
+    if not job['ready']:
+        # the client retries once the job is ready; the query is then
+        # answered from the cache of context queries.
+        return jsonify(dict(job, success=False, retry=True))
     return jsonify({
         'success': True,
-        'data': data.get('data')
+        'data': job['result'].get('data')
     })
 
 
+def features_pending(job: dict) -> dict:
+    """ The response of the feature views while nlp computes the features;
+        the client retries once the job is ready.
+    """
+    return dict(job, success=False, retry=True, watch=True)
+
+
 @container_app.route('/<objectid:corpusid>/features/')
 @check_availability
 def request_features(reqobj):
@@ -381,12 +431,15 @@ def request_features(reqobj):
     corpus = reqobj.get('corpus')
     del reqobj['corpus']
 
-    features, docs = corpus.get_features(**reqobj)
-    return jsonify(dict(
+    job = corpus.features_job(**reqobj)
+    if not job['ready']:
+        return jsonify(features_pending(job))
+    features, docs = job['result']
+    return Response(dumps(dict(
         success=True,
         features=features,
         docs=docs
-    ))
+    )), mimetype='application/json')
 
 
 @container_app.route('/<objectid:corpusid>/features-html/')
@@ -394,7 +447,10 @@ def request_features(reqobj):
 def request_features_html(reqobj):
 
     corpus = reqobj.get('corpus')
-    features, _ = corpus.get_features(**reqobj)
+    job = corpus.features_job(**reqobj)
+    if not job['ready']:
+        return jsonify(features_pending(job))
+    features, _ = job['result']
     features = render_template('corpus/features.html',
                                features=features,
                                corpusid=str(corpus.get('_id')))
@@ -406,50 +462,22 @@ def request_features_html(reqobj):
 def force_directed_graph(reqobj):
     """ Retrieving data (links and nodes) for a force-directed graph. This
         function maps the documents and features to links and nodes.
+
+        The optional 'topk' and 'minweight' parameters prune the edges of
+        each document.
     """
 
     container = reqobj.get('corpus')
     del reqobj['corpus']
 
-    features, docs = container.get_features(**reqobj)
-
-    links, nodes = [], []
-
-    for f in features:
-        f['id'] = uuid.uuid4().hex
-        f['group'] = f['id']
-        f['type'] = 'feature'
-        # cleanup the feat object
-        del f['docs']
-        nodes.append(f)
-
-    def get_feat(feature):
-        for item in nodes:
-            if item.get('features') == feature:
-                return item
-        return None
-    for d in docs:
-        _f = get_feat(d['features'][0]['feature'])
-        d['group'] = _f['id']
-        d['id'] = uuid.uuid4().hex
-        d['type'] = 'document'
-
-        nodes.append(d)
-        for f in d['features']:
-            if _f and f['feature'] == _f:
-                the_feat = _f
-            else:
-                the_feat = get_feat(f['feature'])
-            _f = None
-            if not the_feat:
-                continue
-            links.append(dict(
-                source=d['id'],
-                target=the_feat['id'],
-                weight=f['weight']
-            ))
-        # cleanup the doc object
-        del d['features']
+    job = container.features_job(**reqobj)
+    if not job['ready']:
+        return jsonify(features_pending(job))
+    features, docs = job['result']
+    nodes, links = build_graph(
+        features, docs,
+        top_k=request.args.get('topk', type=int),
+        min_weight=request.args.get('minweight', type=float))
 
     return jsonify(
         dict(
@@ -461,36 +489,35 @@ def force_directed_graph(reqobj):
 @container_app.route('/<objectid:containerid>/kmeans/<int:feats>')
 def kmeans_groups(containerid: str, feats: int):
 
-    container = ContainerModel.inst_by_id(containerid)
-
-    params = celery.send_task(
-        NLP_TASKS['kmeans_files'],
-        kwargs={
-            'path': container.get_folder_path(),
-            'containerid': str(containerid)
-        }).get()
-    params['k'] = feats
-    groups = celery.send_task(
-        RMXCLUSTER_TASKS['kmeans_groups'],
-        kwargs=params
-    ).get()
+    container = ContainerModel.inst_by_id(containerid, fields=['_id'])
 
-    return jsonify({
-        'k': feats,
-        'containerid': containerid,
-        'groups': groups,
-        'success': True,
-        'msg': 'Endpoint used for testing and development.'
-    })
+    # the groups are the result of the job.
+    job = jobs.submit(
+        celery.signature(
+            NLP_TASKS['kmeans_files'],
+            kwargs={
+                'path': container.get_folder_path(),
+                'containerid': str(containerid)
+            }) |
+        celery.signature(RMXBOT_TASKS['kmeans_groups'], kwargs={'k': feats})
+    )
+    return jsonify(dict(
+        job,
+        k=feats,
+        containerid=containerid,
+        success=True,
+        msg='Endpoint used for testing and development.'
+    ))
 
 
 @container_app.route('/<objectid:containerid>/crawl-metrics')
 def crawl_metrics(containerid: str):
     """
     Querying all metrics for scrasync. It is using hte task registered with
-    RMXBOT_TASKS.
+    RMXBOT_TASKS; the view returns the job, its result is the object returned
+    by the task.
 
-    the response = {
+    the prometheus response = {
         'status': 'success',
         'data': {
             'resultType': 'vector',
@@ -509,7 +536,5 @@ def crawl_metrics(containerid: str):
         }
     }
     """
-    return celery.send_task(
-        RMXBOT_TASKS['crawl_metrics'],
-        kwargs={ 'containerid': str(containerid) }
-    ).get()
+    return jsonify(jobs.send(RMXBOT_TASKS['crawl_metrics'],
+                             containerid=str(containerid)))
@@ -0,0 +1,127 @@
+"""Storage for the url objects of large containers.
+
+Containers flagged with 'large_container' do not embed their url objects in
+the 'urls' list; these are kept in a dedicated collection, one document per
+url object, keyed by the container id.
+"""
+from typing import List
+
+import bson
+import pymongo
+
+from ...config import CORPUS_COLL, URLS_COLL
+from ...contrib.db.connection import get_collection
+
+_COLLECTION = get_collection(collection=URLS_COLL)
+
+# fields that are not part of the url object as it is exposed by the container
+_PROJECTION = {'_id': 0, 'containerid': 0}
+
+INDEXES_CREATED = False
+
+
+def ensure_indexes():
+    """Creating the indexes on the collection, once per process."""
+    global INDEXES_CREATED
+    if not INDEXES_CREATED:
+        _COLLECTION.create_indexes([
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('_id', pymongo.ASCENDING)]),
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('data_id', pymongo.ASCENDING)]),
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('file_id', pymongo.ASCENDING)]),
+        ])
+        INDEXES_CREATED = True
+
+
+def insert(containerid: (str, bson.ObjectId), url_obj: dict):
+    """Inserting one url object for a container."""
+    return insert_many(containerid, [url_obj])
+
+
+def insert_many(containerid: (str, bson.ObjectId), url_objs: List[dict]):
+    """Inserting many url objects for a container."""
+    if not url_objs:
+        return None
+    ensure_indexes()
+    containerid = bson.ObjectId(containerid)
+    return _COLLECTION.insert_many(
+        [dict(_, containerid=containerid) for _ in url_objs], ordered=False)
+
+
+def upsert_many(containerid: (str, bson.ObjectId), url_objs: List[dict]):
+    """Idempotent insertion of url objects; these are keyed on data_id."""
+    if not url_objs:
+        return None
+    ensure_indexes()
+    containerid = bson.ObjectId(containerid)
+    return _COLLECTION.bulk_write([
+        pymongo.ReplaceOne(
+            {'containerid': containerid, 'data_id': _.get('data_id')},
+            dict(_, containerid=containerid),
+            upsert=True
+        ) for _ in url_objs
+    ], ordered=False)
+
+
+def find(containerid: (str, bson.ObjectId), projection: dict = None,
+         limit: int = 0):
+    """Returns a cursor over the url objects of a container, in insertion
+       order.
+    """
+    return _COLLECTION.find(
+        {'containerid': bson.ObjectId(containerid)},
+        projection or _PROJECTION
+    ).sort('_id', pymongo.ASCENDING).limit(limit)
+
+
+def find_by_ids(containerid: (str, bson.ObjectId), docids: List[str]):
+    """Returns a cursor over the url objects whose data_id or file_id is in
+       docids.
+    """
+    docids = list(docids)
+    return _COLLECTION.find({
+        'containerid': bson.ObjectId(containerid),
+        '$or': [{'data_id': {'$in': docids}}, {'file_id': {'$in': docids}}]
+    }, _PROJECTION)
+
+
+def first_urls(containerids: List[bson.ObjectId], limit: int = 10) -> dict:
+    """Returns the first url objects of many containers with one query; a
+       mapping of container ids to lists of url objects.
+    """
+    if not containerids:
+        return {}
+    containerids = [bson.ObjectId(_) for _ in containerids]
+    cursor = get_collection(collection=CORPUS_COLL).aggregate([
+        {'$match': {'_id': {'$in': containerids}}},
+        {'$lookup': {
+            'from': URLS_COLL,
+            'let': {'containerid': '$_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$containerid',
+                                              '$$containerid']}}},
+                {'$sort': {'_id': pymongo.ASCENDING}},
+                {'$limit': limit},
+                {'$project': _PROJECTION}
+            ],
+            'as': 'urls'
+        }},
+        {'$project': {'urls': 1}}
+    ])
+    return {_['_id']: _['urls'] for _ in cursor}
+
+
+def count(containerid: (str, bson.ObjectId)) -> int:
+    """Returns the number of url objects in a container."""
+    return _COLLECTION.count_documents(
+        {'containerid': bson.ObjectId(containerid)})
+
+
+def delete(containerid: (str, bson.ObjectId), data_ids: List[str]):
+    """Deleting url objects given their data ids."""
+    return _COLLECTION.delete_many({
+        'containerid': bson.ObjectId(containerid),
+        'data_id': {'$in': list(data_ids)}
+    })
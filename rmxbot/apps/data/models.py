@@ -2,17 +2,21 @@
    scraped web page. """
 import datetime
 import hashlib
+import io
 import os
 import stat
 import uuid
 
 import bson
+import pymongo
 from pymongo import UpdateOne
 
 from ...config import CORPUS_ROOT, DATA_COLL, TEXT_FOLDER
 from ...contrib.db.models.document import Document
 from ...contrib.db.models.fields.urlfield import UrlField
 from ...contrib.utils import dictionary
+from ...core.text_index import build_text_index
+from ...core.textstore import get_store
 from .errors import DuplicateUrlError
 
 from ...contrib.db.connection import get_collection
@@ -20,6 +24,8 @@ from ...contrib.db.connection import get_collection
 
 _COLLECTION = get_collection(collection=DATA_COLL)
 
+INDEXES_CREATED = False
+
 LISTURLS_PROJECT = {
     'id': '$_id',
     'url': '$url',
@@ -40,6 +46,24 @@ LIST_SCREENPLAYS_PROJECT = {
 }
 
 
+def ensure_indexes():
+    """Creating the indexes on the collection, once per process."""
+    global INDEXES_CREATED
+    if not INDEXES_CREATED:
+        # exact duplicates within a container
+        _COLLECTION.create_index([('corpusid', pymongo.ASCENDING),
+                                  ('hashtxt', pymongo.ASCENDING)])
+        INDEXES_CREATED = True
+
+
+def text_hash(data: list) -> str:
+    """Returns the hash (hashtxt) of the text of a page."""
+    hasher = hashlib.md5()
+    for txt in data:
+        hasher.update(bytes(txt, 'utf-8'))
+    return hasher.hexdigest()
+
+
 class DataModel(Document):
     """ This model holds the scrapped pages along with the links, images and
     the word count.
@@ -142,6 +166,7 @@ class DataModel(Document):
 
         data_obj = cls()
         data_obj['title'] = title
+        data_obj['corpusid'] = corpus_id
         data_obj['links'] = list(set(links))
         data_obj['url'] = UrlField(endpoint).get_value()
 
@@ -161,6 +186,23 @@ class DataModel(Document):
         assert isinstance(bson.ObjectId(docid), bson.ObjectId)
         return data_obj, file_id
 
+    @classmethod
+    def hashtxt_exists(cls, corpusid: str, hashtxt: str) -> bool:
+        """Returns True if the container holds a text with this hash."""
+        ensure_indexes()
+        return _COLLECTION.find_one(
+            {'corpusid': corpusid, 'hashtxt': hashtxt}, {'_id': 1}) is not None
+
+    @classmethod
+    def fileid_by_hashtxt(cls, corpusid: str, hashtxt: str):
+        """Returns the file id of the container's text with this hash, or
+           None.
+        """
+        ensure_indexes()
+        doc = _COLLECTION.find_one({'corpusid': corpusid, 'hashtxt': hashtxt},
+                                   {'_id': 0, 'fileid': 1})
+        return doc.get('fileid') if doc else None
+
     @classmethod
     def inst_by_id(cls, docid):
         """
@@ -187,27 +229,29 @@ class DataModel(Document):
         # return str(self.get_id())
 
     def data_to_corpus(self, path, data, file_id: str = None):
-        """ Dumping data into a corpus file. """
-
-        path = os.path.normpath(os.path.join(path, file_id))
-
-        if os.path.isfile(path):
+        """ Dumping data into a corpus file; this is written to the store of
+            the container.
+        """
+        store = get_store(path)
+        if store.exists(file_id):
             raise DuplicateUrlError
         self.save()
 
         hasher = hashlib.md5()
-
-        with open(path, 'a+') as _file:
-            for txt in data:
-                hasher.update(bytes(txt, 'utf-8'))
-                _file.write(txt)
-                # _file.write(txt.encode(encoding='UTF-8'))
-                _file.write('\n\n')
+        content = io.BytesIO()
+        for txt in data:
+            txt = bytes(txt, 'utf-8')
+            hasher.update(txt)
+            content.write(txt)
+            content.write(b'\n\n')
 
         self['hashtxt'] = hasher.hexdigest()
+        try:
+            store.write(file_id, content.getvalue())
+        except FileExistsError:
+            raise DuplicateUrlError
 
-        # permissions 'read, write, execute' to user, group, other (777)
-        os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+        build_text_index(path, file_id)
         return file_id
 
     def chmod_file(self, path: str = None, fileid: str = None):
@@ -232,8 +276,7 @@ class DataModel(Document):
         :param value:
         :return:
         """
-        if _COLLECTION.find_one({
-            'corpusid': self.get('corpusid'), 'hashtxt': value}):
+        if self.hashtxt_exists(self.get('corpusid'), value):
             raise ValueError(self)
         return _COLLECTION.update_one(
             {'_id': self.get_id()},
@@ -22,6 +22,16 @@ DATA_ROOT = os.environ.get('DATA_ROOT')
 # TMP_DATA_DIR = '/data/tmp'
 TMP_DATA_DIR = os.environ.get('TMP_DATA_DIR')
 
+# page payloads (text and links) larger than SPOOL_THRESHOLD bytes are not
+# sent in celery messages; producers write these to SPOOL_DIR and send a
+# reference (claim check).
+SPOOL_DIR = os.environ.get('SPOOL_DIR', os.path.join(DATA_ROOT, 'spool'))
+SPOOL_THRESHOLD = int(os.environ.get('SPOOL_THRESHOLD', 64 * 1024))
+# spool files older than this (seconds) were not consumed and are removed.
+SPOOL_MAX_AGE = int(os.environ.get('SPOOL_MAX_AGE', 86400))
+# the interval (seconds) at which stale spool files are removed.
+SPOOL_PURGE_INTERVAL = int(os.environ.get('SPOOL_PURGE_INTERVAL', 3600))
+
 EXTRACTXT_ENDPOINT = os.environ.get('EXTRACTXT_ENDPOINT')
 
 EXTRACTXT_FILES_UPLOAD_URL = '{}/upload-files'.format(EXTRACTXT_ENDPOINT)
@@ -30,6 +40,38 @@ EXTRACTXT_FILES_UPLOAD_URL = '{}/upload-files'.format(EXTRACTXT_ENDPOINT)
 CORPUS_ROOT = os.path.join(DATA_ROOT, 'container')
 TEXT_FOLDER = 'text'
 MATRIX_FOLDER = 'matrix'
+# sidecar files (offsets of paragraphs, etc.) for the texts of a container.
+INDEX_FOLDER = 'index'
+
+# the store of the texts in new containers: 'files' (one file per text in
+# TEXT_FOLDER) or 'segments' (texts appended to large segment files in
+# SEGMENTS_FOLDER).
+TEXT_STORE = os.environ.get('TEXT_STORE', 'files')
+SEGMENTS_FOLDER = 'segments'
+# with TEXT_BLOBS, texts in the 'files' store are hard links to blobs kept
+# once in BLOBS_ROOT, keyed by the hash of the text.
+TEXT_BLOBS = os.environ.get('TEXT_BLOBS', '').lower() in ('1', 'true', 'yes')
+BLOBS_ROOT = os.path.join(DATA_ROOT, 'blobs')
+# the size (bytes) at which a new segment file is started.
+TEXT_SEGMENT_SIZE = int(os.environ.get('TEXT_SEGMENT_SIZE', 64 * 1024 ** 2))
+# segments are compacted when the ratio of deleted bytes exceeds this.
+TEXT_COMPACT_RATIO = float(os.environ.get('TEXT_COMPACT_RATIO', 0.5))
+# compression of the texts in segments: '' (none), 'zlib' or 'zstd' (this
+# requires the zstandard package).
+TEXT_COMPRESSION = os.environ.get('TEXT_COMPRESSION', '')
+TEXT_COMPRESSION_LEVEL = int(os.environ.get('TEXT_COMPRESSION_LEVEL', 6))
+# with zstd, a dictionary is trained for the container once it holds
+# TEXT_DICT_SAMPLES texts (0 disables dictionaries).
+TEXT_DICT_SAMPLES = int(os.environ.get('TEXT_DICT_SAMPLES', 500))
+TEXT_DICT_SIZE = int(os.environ.get('TEXT_DICT_SIZE', 112640))
+# texts of segments are exported to TEXT_FOLDER for nlp; with TEXT_EXPORT_KEEP
+# the exported files are kept after the run, so that the next export only
+# writes the texts added since.
+TEXT_EXPORT_KEEP = os.environ.get(
+    'TEXT_EXPORT_KEEP', 'true').lower() in ('1', 'true', 'yes')
+# the number of segment indexes kept in memory in each process.
+SEGMENT_INDEX_CACHE_SIZE = int(
+    os.environ.get('SEGMENT_INDEX_CACHE_SIZE', 64))
 
 CORPUS_MAX_SIZE = 500
 
@@ -46,18 +88,95 @@ DATA_COLL = 'data'
 IMAGE_COLL = 'image'
 CORPUS_COLL = 'corpus'
 CLUSTER_COLL = 'cluster'
+# url objects of containers that are in the "large container" storage mode.
+URLS_COLL = 'container_urls'
+
+# when enabled, new containers keep their url objects in URLS_COLL instead of
+# the embedded 'urls' list of the container document.
+LARGE_CONTAINERS = os.environ.get(
+    'LARGE_CONTAINERS', '').lower() in ('1', 'true', 'yes')
+
+# the engine answering context queries (sentences that contain words):
+# 'rmxgrep' (the rmxgrep worker) or 'local' (an inverted index kept in
+# CONTEXT_COLL).
+CONTEXT_ENGINE = os.environ.get('CONTEXT_ENGINE', 'rmxgrep')
+CONTEXT_COLL = 'context_index'
+
+# texts whose estimated (MinHash) similarity to a text of the container is at
+# least NEAR_DUP_THRESHOLD are not added to it, i.e. 0.9 (0, the default,
+# disables the detection).
+NEAR_DUP_THRESHOLD = float(os.environ.get('NEAR_DUP_THRESHOLD', 0))
+# signatures of the texts in containers and the texts that were suppressed.
+NEAR_DUP_COLL = 'near_duplicates'
+SUPPRESSED_COLL = 'suppressed_texts'
 
 
 # monitor the crawl every 5 seconds
 CRAWL_MONITOR_COUNTDOWN = 5
 # wait 10 s before starting to monitor
 CRAWL_START_MONITOR_COUNTDOWN = 10
+# the interval (seconds) at which the sweeper checks all active crawls.
+CRAWL_SWEEP_INTERVAL = int(os.environ.get('CRAWL_SWEEP_INTERVAL', 5))
 
 REQUEST_MAX_RETRIES = 5
+# outbound http (core.http_request): the number of hosts and of connections
+# per host kept in the pool of each process, the backoff factor of retries
+# and the default (connect, read) timeouts in seconds.
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.3))
+HTTP_TIMEOUT = (3.05, 30)
 # time to wait in seconds after the last call made inside the crawler.
 # after that the container is set as ready
 SECONDS_AFTER_LAST_CALL = 30
 
+# url objects created while crawling are buffered in redis and written to the
+# container in one update, once the buffer holds URLOBJ_BUFFER_SIZE objects or
+# its oldest object is URLOBJ_BUFFER_SECONDS old.
+URLOBJ_BUFFER_SIZE = int(os.environ.get('URLOBJ_BUFFER_SIZE', 200))
+URLOBJ_BUFFER_SECONDS = int(os.environ.get('URLOBJ_BUFFER_SECONDS', 5))
+
+# the number of lemma indexes (core.lemma_index) kept open in each process.
+LEMMA_INDEX_CACHE_SIZE = int(os.environ.get('LEMMA_INDEX_CACHE_SIZE', 32))
+
+# the number of containers whose available features (core.matrix_files) are
+# kept in each process.
+AVAILABLE_FEATURES_CACHE_SIZE = int(
+    os.environ.get('AVAILABLE_FEATURES_CACHE_SIZE', 256))
+
+# features and docs returned by nlp are cached; the number of entries kept in
+# each web process and in redis, and the time to live (seconds) in redis.
+FEATURES_CACHE_SIZE = int(os.environ.get('FEATURES_CACHE_SIZE', 128))
+FEATURES_CACHE_REDIS_SIZE = int(
+    os.environ.get('FEATURES_CACHE_REDIS_SIZE', 4096))
+FEATURES_CACHE_TTL = int(os.environ.get('FEATURES_CACHE_TTL', 86400))
+
+# context queries answered by rmxgrep are cached; the number of entries kept in
+# each web process and in redis, and the time to live (seconds) in redis -
+# short, as the texts of a container change while it is crawled.
+CONTEXT_CACHE_SIZE = int(os.environ.get('CONTEXT_CACHE_SIZE', 128))
+CONTEXT_CACHE_REDIS_SIZE = int(
+    os.environ.get('CONTEXT_CACHE_REDIS_SIZE', 4096))
+CONTEXT_CACHE_TTL = int(os.environ.get('CONTEXT_CACHE_TTL', 300))
+
+# the time (seconds) for which the results of jobs (tasks enqueued by views
+# and polled by clients) are kept in the result backend.
+JOB_RESULT_EXPIRES = int(os.environ.get('JOB_RESULT_EXPIRES', 3600))
+
+# the time (seconds) for which a job started with a key (core.jobs.submit) is
+# returned instead of a new one; about the deadline of the longest remote
+# task, so that a job lost by a worker is started again.
+JOB_KEY_TTL = int(os.environ.get('JOB_KEY_TTL', 180))
+
+# calls to remote workers that wait for the result (core.rpc): the default
+# deadline (seconds), the calls in flight per queue and process, and the
+# circuit breaker - the number of failed calls in a row that opens it and the
+# time (seconds) after which a call is tried again.
+RPC_DEADLINE = int(os.environ.get('RPC_DEADLINE', 30))
+RPC_MAX_CONCURRENCY = int(os.environ.get('RPC_MAX_CONCURRENCY', 8))
+RPC_BREAKER_FAILURES = int(os.environ.get('RPC_BREAKER_FAILURES', 5))
+RPC_BREAKER_RESET = int(os.environ.get('RPC_BREAKER_RESET', 30))
+
 # REDIS CONFIG
 # celery, redis (auth access) configuration
 BROKER_HOST_NAME = os.environ.get('BROKER_HOST_NAME')
@@ -88,3 +207,9 @@ RPC_PORT = os.environ.get('RABBITMQ_PORT', 5672)
 PROMETHEUS_HOST = os.environ.get('PROMETHEUS_HOST')
 PROMETHEUS_PORT = os.environ.get('PROMETHEUS_PORT')
 PROMETHEUS_URL = f'{PROMETHEUS_HOST}:{PROMETHEUS_PORT}/api/v1'
+# (connect, read) timeouts of the requests to prometheus, in seconds.
+PROMETHEUS_TIMEOUT = (3.05, 10)
+# the series of finished crawls are deleted; this requires prometheus to run
+# with --web.enable-admin-api.
+PROMETHEUS_DELETE_SERIES = os.environ.get(
+    'PROMETHEUS_DELETE_SERIES', 'true').lower() in ('1', 'true', 'yes')
@@ -1,6 +1,9 @@
 """ implementation of a Base Document to be used in order to talk to docs
 within data collecitons """
 
+import base64
+import datetime
+
 import pymongo
 import bson
 
@@ -16,6 +19,9 @@ class Document(RmxDict):
 
     structure = {}
 
+    # set on instances that were loaded with a subset of their fields
+    _deferred = False
+
     def __init__(self, *args, **kwds):
 
         super().__init__(*args, **kwds)
@@ -44,17 +50,57 @@ class Document(RmxDict):
         return cls.__collection__.find().batch_size(250).sort(
             "created", pymongo.DESCENDING).limit(limit)
 
+    def __missing__(self, key):
+        """ Called for keys that are not in the document. Deferred fields
+            are fetched from the database on first access.
+        """
+        if self._deferred:
+            self.load_deferred()
+            if key in self.dict:
+                return self.dict[key]
+        raise KeyError(key)
+
     @classmethod
-    def inst_by_id(cls, docid):
+    def inst_by_id(cls, docid, fields: list = None):
         """ Instantiating a document by id.
+
+            If a list of (top level) fields is given, only these are loaded;
+            the remaining fields are fetched on first access.
         """
-        doc = cls.__collection__.find_one({"_id": bson.ObjectId(docid)})
+        projection = dict.fromkeys(fields, 1) if fields else None
+        doc = cls.__collection__.find_one(
+            {"_id": bson.ObjectId(docid)}, projection)
         if doc and isinstance(doc.get('_id'), bson.ObjectId):
             instance = cls()
+            if fields:
+                # default values are applied when the rest is loaded.
+                instance.dict = {}
             dictionary.update(instance, doc)
+            if fields:
+                # requested fields that the document lacks are not deferred.
+                defaults = getattr(instance, 'default_values', {})
+                for key in fields:
+                    if key not in instance.dict:
+                        instance.dict[key] = defaults.get(key)
+            instance._deferred = bool(fields)
             return instance
         return 0
 
+    def load_deferred(self):
+        """ Loading the fields that were left out by a partial inst_by_id.
+        """
+        if not self._deferred:
+            return self
+        self._deferred = False
+        doc = self.__collection__.find_one(
+            {'_id': self.dict.get('_id')}, dict.fromkeys(self.dict, 0))
+        if doc:
+            dictionary.update(self, doc)
+        for k, v in getattr(self, 'default_values', {}).items():
+            if not any_value(self.dict.get(k)):
+                self[k] = v
+        return self
+
     @classmethod
     def inst_from_doc(cls, doc):
         """ given a class object and a document, returns its instance """
@@ -92,6 +138,23 @@ class Document(RmxDict):
             query, projection).sort('created', direct).skip(
                 start).limit(limit)
 
+    @classmethod
+    def keyset_query(cls, query={}, projection=None, after: str = None,
+                     limit=100, direct=pymongo.DESCENDING):
+        """ range query on (created, _id) that starts after the document the
+            cursor points to. Its cost does not depend on the page's depth.
+        """
+        if after:
+            created, docid = decode_cursor(after)
+            _op = '$lt' if direct == pymongo.DESCENDING else '$gt'
+            keyset = {'$or': [
+                {'created': {_op: created}},
+                {'created': created, '_id': {_op: docid}}
+            ]}
+            query = {'$and': [query, keyset]} if query else keyset
+        return cls.__collection__.find(query, projection).sort([
+            ('created', direct), ('_id', direct)]).limit(limit)
+
     @classmethod
     def simple_validation(cls, doc):
         """ Simple validation going one level into the doc."""
@@ -111,6 +174,27 @@ class Document(RmxDict):
         return self.__collection__.delete_one({'_id': self.get_id()})
 
 
+def encode_cursor(doc) -> str:
+    """ Returns an opaque cursor pointing to a document; used by
+        keyset_query.
+    """
+    value = '{}|{}'.format(doc['created'].isoformat(), doc['_id'])
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """ Returns the (created, _id) pair a cursor points to. Raises ValueError
+        for malformed cursors.
+    """
+    try:
+        created, docid = base64.urlsafe_b64decode(
+            cursor.encode('ascii')).decode('utf-8').split('|')
+        return (datetime.datetime.fromisoformat(created),
+                bson.ObjectId(docid))
+    except (TypeError, ValueError, bson.errors.InvalidId) as err:
+        raise ValueError(cursor) from err
+
+
 def any_value(value):
     """ Checking if there is any value attached to the variable. """
 
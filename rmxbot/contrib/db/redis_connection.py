@@ -0,0 +1,19 @@
+""" The module getting the redis connection. """
+import redis
+
+from ...config import BROKER_HOST_NAME, REDIS_DB_NUMBER, REDIS_PASS, REDIS_PORT
+
+CLIENT = None
+
+
+def get_redis():
+    """ returns the redis client; the connection pool is shared within the
+        process.
+    """
+    global CLIENT
+    if not isinstance(CLIENT, redis.Redis):
+        CLIENT = redis.Redis(host=BROKER_HOST_NAME,
+                             port=int(REDIS_PORT or 6379),
+                             db=int(REDIS_DB_NUMBER or 0),
+                             password=REDIS_PASS)
+    return CLIENT
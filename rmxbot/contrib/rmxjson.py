@@ -1,5 +1,6 @@
 """Handling json."""
 
+import collections.abc
 import json
 import bson
 import datetime
@@ -24,3 +25,31 @@ class RmxEncoder(json.JSONEncoder):
             else:
                 raise TypeError(_o)
         super(RmxEncoder, self).default(_o, *args, **kwds)
+
+
+# compact encoder; the default hook is only called for non json types.
+_JSON_ENCODER = RmxEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def to_json_ready(_o):
+    """Walks a document once and returns a structure that contains only json
+       types; ObjectIds and uuids are converted to strings, dates and times to
+       their isoformat. This replaces json.loads(RmxEncoder().encode(doc)).
+    """
+    if _o is None or isinstance(_o, (str, int, float,)):
+        # bool and bson's Int64 are ints
+        return _o
+    if isinstance(_o, collections.abc.Mapping):
+        return {str(k): to_json_ready(v) for k, v in _o.items()}
+    if isinstance(_o, (list, tuple,)):
+        return [to_json_ready(_) for _ in _o]
+    if isinstance(_o, (bson.ObjectId, uuid.UUID,)):
+        return str(_o)
+    if isinstance(_o, (datetime.datetime, datetime.date, datetime.time,)):
+        return _o.isoformat()
+    raise TypeError(_o)
+
+
+def dumps(_o) -> bytes:
+    """Encodes a document (that may contain bson types) to json bytes."""
+    return _JSON_ENCODER.encode(_o).encode('utf-8')
@@ -0,0 +1,88 @@
+"""Two-tier cache for computed results: an in-process LRU in front of redis.
+
+Values are stored as JSON; these are decoded on every hit, so that callers get
+their own copy of the data.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+
+import redis
+
+from ..contrib.db.redis_connection import get_redis
+from ..contrib.rmxjson import dumps
+
+
+class ResultCache:
+    """Size-bounded cache. The in-process tier evicts the least recently used
+       entries; the redis tier evicts the least recently written ones and
+       expires entries after ttl seconds.
+    """
+
+    def __init__(self, name: str, maxsize: int = 128,
+                 redis_maxsize: int = 4096, ttl: int = 86400):
+
+        self.name = name
+        self.maxsize = maxsize
+        self.redis_maxsize = redis_maxsize
+        self.ttl = ttl
+
+        self._lru = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key): return f'rmxbot:cache:{self.name}:{key}'
+
+    @property
+    def _redis_index(self): return f'rmxbot:cache:{self.name}'
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns the cached object or None."""
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+        if value is None:
+            try:
+                value = get_redis().get(self._redis_key(key))
+            except redis.RedisError as err:
+                logging.warning(err)
+                return None
+            if value is None:
+                return None
+            self._remember(key, value)
+        return json.loads(value)
+
+    def set(self, key: str, obj):
+        """Caching an object that can be encoded with rmxjson.dumps."""
+        value = dumps(obj)
+        self._remember(key, value)
+        try:
+            conn = get_redis()
+            pipe = conn.pipeline()
+            pipe.set(self._redis_key(key), value, ex=self.ttl)
+            pipe.zadd(self._redis_index, {key: time.time()})
+            pipe.zcard(self._redis_index)
+            size = pipe.execute()[-1]
+            if size > self.redis_maxsize:
+                evicted = conn.zpopmin(
+                    self._redis_index, size - self.redis_maxsize)
+                if evicted:
+                    conn.delete(*[self._redis_key(_[0].decode())
+                                  for _ in evicted])
+        except redis.RedisError as err:
+            logging.warning(err)
+        return obj
+
+    def clear(self):
+        """Clearing the in-process tier."""
+        with self._lock:
+            self._lru.clear()
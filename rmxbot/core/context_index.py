@@ -0,0 +1,256 @@
+"""Local engine for context queries - the sentences of a container that
+contain one or more words. This is an alternative to the rmxgrep worker,
+enabled with CONTEXT_ENGINE = 'local'.
+
+The engine keeps an inverted index in CONTEXT_COLL, one document per range
+of PART_SIZE sentences of a text file, so that the postings of a large file
+do not exceed the size of a document:
+
+    {
+        containerid: ObjectId,
+        file_id: str,
+        part: int,
+        words: [the distinct (lower case) words in the range],
+        postings: {word: [sentence numbers]}
+    }
+
+Files are indexed when they are added to a container and removed from the
+index when they are deleted. Containers created before the engine was
+enabled are indexed by the index_context task, sent by the first query;
+index_container marks the container as indexed with a document whose file_id
+is None, and queries go to rmxgrep until then.
+
+A query selects the files that contain the words with the (containerid,
+words) index, then reads the matching sentences with a seek, given the
+sentences sidecar of the file (see text_index). The words of a query are
+split on non-word characters, as the words of the texts.
+"""
+import hashlib
+import re
+from typing import List
+
+import bson
+import pymongo
+
+from ..app import celery
+from ..config import (CONTEXT_CACHE_REDIS_SIZE, CONTEXT_CACHE_SIZE,
+                      CONTEXT_CACHE_TTL, CONTEXT_COLL, CONTEXT_ENGINE)
+from ..contrib.db.connection import get_collection
+from ..contrib.db.redis_connection import get_redis
+from ..contrib.rmxjson import dumps
+from ..tasks.celeryconf import RMXBOT_TASKS, RMXGREP_TASK
+from . import jobs
+from .cache import ResultCache
+from .sentences import words as text_words
+from .text_index import load_sentence_index, sentences_by_number
+from .textstore import get_store
+
+_COLLECTION = get_collection(collection=CONTEXT_COLL)
+
+HIGHLIGHT = r'<span class="highlight">\1</span>'
+
+# the number of sentences per document of the index.
+PART_SIZE = 1000
+
+# the key sent once per container, while the container is indexed.
+INDEX_KEY = 'rmxbot:context-index:{}'
+INDEX_KEY_TTL = 3600
+
+# the results of rmxgrep, as returned by search_job
+CONTEXT_CACHE = ResultCache('context',
+                            maxsize=CONTEXT_CACHE_SIZE,
+                            redis_maxsize=CONTEXT_CACHE_REDIS_SIZE,
+                            ttl=CONTEXT_CACHE_TTL)
+
+INDEXES_CREATED = False
+
+
+def ensure_indexes():
+    """Creating the indexes on the collection, once per process."""
+    global INDEXES_CREATED
+    if not INDEXES_CREATED:
+        _COLLECTION.create_indexes([
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('file_id', pymongo.ASCENDING),
+                                ('part', pymongo.ASCENDING)],
+                               unique=True),
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('words', pymongo.ASCENDING)]),
+        ])
+        INDEXES_CREATED = True
+
+
+def enabled() -> bool:
+    return CONTEXT_ENGINE == 'local'
+
+
+def file_entries(texts_path: str, fileid: str) -> List[dict]:
+    """Returns the index entries of a text file, one per PART_SIZE
+       sentences.
+    """
+    offsets = load_sentence_index(texts_path, fileid)
+    content = get_store(texts_path).read(fileid)
+    out = []
+    for start in range(0, max(len(offsets) // 2, 1), PART_SIZE):
+        postings = {}
+        for idx in range(start, min(start + PART_SIZE, len(offsets) // 2)):
+            for word in text_words(content[
+                    offsets[2 * idx]:offsets[2 * idx + 1]].decode(
+                        'utf-8', errors='replace')):
+                postings.setdefault(word, []).append(idx)
+        out.append({
+            'file_id': fileid,
+            'part': start // PART_SIZE,
+            'words': sorted(postings),
+            'postings': postings
+        })
+    return out
+
+
+def index_file(containerid: (str, bson.ObjectId), texts_path: str,
+               fileid: str):
+    """Adding a text file to the index of a container."""
+    return index_files(containerid, texts_path, [fileid])
+
+
+def index_files(containerid: (str, bson.ObjectId), texts_path: str,
+                fileids: List[str]):
+    """Adding text files to the index of a container."""
+    if not fileids:
+        return None
+    ensure_indexes()
+    containerid = bson.ObjectId(containerid)
+    requests = []
+    for fileid in fileids:
+        entries = file_entries(texts_path, fileid)
+        requests.extend(pymongo.ReplaceOne(
+            {'containerid': containerid, 'file_id': fileid,
+             'part': _['part']},
+            dict(_, containerid=containerid),
+            upsert=True
+        ) for _ in entries)
+        # the parts of a previous, longer version of the file
+        requests.append(pymongo.DeleteMany({
+            'containerid': containerid, 'file_id': fileid,
+            'part': {'$gte': len(entries)}}))
+    return _COLLECTION.bulk_write(requests, ordered=False)
+
+
+def index_container(containerid: (str, bson.ObjectId), texts_path: str):
+    """Indexing all the text files of a container, then marking it as
+       indexed.
+    """
+    fileids = get_store(texts_path).fileids()
+    for idx in range(0, len(fileids), 100):
+        index_files(containerid, texts_path, fileids[idx:idx + 100])
+    ensure_indexes()
+    containerid = bson.ObjectId(containerid)
+    _COLLECTION.replace_one(
+        {'containerid': containerid, 'file_id': None, 'part': 0},
+        {'containerid': containerid, 'file_id': None, 'part': 0,
+         'words': []},
+        upsert=True)
+
+
+def indexed(containerid: (str, bson.ObjectId)) -> bool:
+    """Whether all the files of a container were indexed."""
+    return _COLLECTION.find_one(
+        {'containerid': bson.ObjectId(containerid), 'file_id': None},
+        {'_id': 1}) is not None
+
+
+def schedule_index(containerid: (str, bson.ObjectId)) -> bool:
+    """Sending index_context for a container, once."""
+    if not get_redis().set(INDEX_KEY.format(containerid), 1, nx=True,
+                           ex=INDEX_KEY_TTL):
+        return False
+    celery.send_task(RMXBOT_TASKS['index_context'],
+                     kwargs={'corpusid': str(containerid)})
+    return True
+
+
+def delete_files(containerid: (str, bson.ObjectId), fileids: List[str]):
+    """Removing text files from the index of a container."""
+    return _COLLECTION.delete_many({
+        'containerid': bson.ObjectId(containerid),
+        'file_id': {'$in': list(fileids)}
+    })
+
+
+def search(containerid: (str, bson.ObjectId), texts_path: str,
+           words: List[str], highlight: bool = False) -> dict:
+    """Returns the sentences that contain one or more words, per file:
+       {fileid: [sentences]}. Phrases are split into words.
+    """
+    words = sorted(set().union(*(text_words(_) for _ in words)),
+                   key=len, reverse=True)
+    if not words:
+        return {}
+    containerid = bson.ObjectId(containerid)
+
+    pattern = re.compile(
+        r'\b(%s)\b' % '|'.join(map(re.escape, words)), re.IGNORECASE)
+    projection = {'_id': 0, 'file_id': 1}
+    projection.update(('postings.{}'.format(_), 1) for _ in words)
+
+    numbers = {}
+    for doc in _COLLECTION.find(
+            {'containerid': containerid, 'words': {'$in': words}},
+            projection):
+        numbers.setdefault(doc['file_id'], set()).update(
+            num for nums in doc.get('postings', {}).values() for num in nums)
+    out = {}
+    for fileid, nums in numbers.items():
+        sentences = [
+            pattern.sub(HIGHLIGHT, _) if highlight else _
+            for _ in sentences_by_number(texts_path, fileid, sorted(nums))
+            if pattern.search(_)
+        ]
+        if sentences:
+            out[fileid] = sentences
+    return out
+
+
+def _rmxgrep_kwargs(texts_path: str, words: List[str],
+                    highlight: bool) -> dict:
+
+    kwargs = {'words': words, 'container_path': texts_path}
+    if highlight:
+        kwargs['highlight'] = True
+    return kwargs
+
+
+def context_key(containerid: (str, bson.ObjectId), words: List[str],
+                highlight: bool = False) -> str:
+    """The key of a context query in CONTEXT_CACHE."""
+    return '{}:{}'.format(containerid, hashlib.sha1(
+        dumps([sorted(words), bool(highlight)])).hexdigest())
+
+
+def search_job(containerid: (str, bson.ObjectId), texts_path: str,
+               words: List[str], highlight: bool = False) -> dict:
+    """Answering a context query with the configured engine; returns a job
+       (see core.jobs), whose result is the object returned by rmxgrep:
+       {'data': {fileid: [sentences]}}. The local engine answers at once,
+       once the container is indexed. The results of rmxgrep are cached by
+       the cache_context task, so that the query, repeated once the job is
+       ready, is answered from the cache.
+    """
+    if enabled():
+        if indexed(containerid):
+            return jobs.done({'data': search(containerid, texts_path, words,
+                                             highlight=highlight)})
+        schedule_index(containerid)
+    words = sorted(set(words))
+    cache_key = context_key(containerid, words, highlight)
+    cached = CONTEXT_CACHE.get(cache_key)
+    if cached is not None:
+        return jobs.done(cached)
+    return jobs.submit(
+        celery.signature(RMXGREP_TASK['search_text'],
+                         kwargs=_rmxgrep_kwargs(texts_path, words,
+                                                highlight)) |
+        celery.signature(RMXBOT_TASKS['cache_context'],
+                         kwargs={'cache_key': cache_key}),
+        key=f'context:{cache_key}'
+    )
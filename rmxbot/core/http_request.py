@@ -1,26 +1,72 @@
+"""Outbound http requests.
+
+All requests go through one session per process, so that connections are
+pooled and kept alive. The session is created again in forked processes
+(i.e. celery prefork workers), as these must not share the sockets of their
+parent.
+"""
+import os
 
 import requests
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from ..config import REQUEST_MAX_RETRIES
+from ..config import (HTTP_BACKOFF_FACTOR, HTTP_POOL_CONNECTIONS,
+                      HTTP_POOL_MAXSIZE, HTTP_TIMEOUT, REQUEST_MAX_RETRIES)
 
+SESSION = None
+_PID = None
 
-def _session(session):
 
-    session = session or requests.Session()
-    adapter = HTTPAdapter(max_retries=REQUEST_MAX_RETRIES)
+def _reset():
+    global SESSION, _PID
+    SESSION = None
+    _PID = None
+
 
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _session(session: requests.Session = None) -> requests.Session:
+    """Mounting the pooled adapters on a session; retries with backoff on
+       connection errors and on 502, 503 and 504 responses.
+    """
+    session = session or requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(total=REQUEST_MAX_RETRIES,
+                          backoff_factor=HTTP_BACKOFF_FACTOR,
+                          status_forcelist=(502, 503, 504),
+                          raise_on_status=False)
+    )
     session.mount('http://', adapter)
+    session.mount('https://', adapter)
     return session
 
 
+def get_session() -> requests.Session:
+    """Returns the session of the process."""
+    global SESSION, _PID
+    if SESSION is None or _PID != os.getpid():
+        SESSION = _session()
+        _PID = os.getpid()
+    return SESSION
+
+
+def request(method: str, endpoint: str = None,
+            session: requests.Session = None, **kwds):
+
+    kwds.setdefault('timeout', HTTP_TIMEOUT)
+    return (session or get_session()).request(method, endpoint, **kwds)
+
+
 def get(endpoint: str = None, session: requests.Session = None, **kwds):
 
-    session = _session(session=session)
-    return session.get(endpoint, **kwds)
+    return request('GET', endpoint, session=session, **kwds)
 
 
 def post(endpoint: str = None, session: requests.Session = None, **kwds):
 
-    session = _session(session=session)
-    return session.post(endpoint, **kwds)
+    return request('POST', endpoint, session=session, **kwds)
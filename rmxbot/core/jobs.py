@@ -0,0 +1,110 @@
+"""Jobs: remote work started by a request and polled by the client.
+
+Instead of waiting for the result of a task, views enqueue the task (or a
+chain) and return the job; its result is then read with status(), i.e. from
+the /container/job/<jobid>/ route or the job field of the graphql api.
+A job is a dict: {'jobid', 'state', 'ready', 'success'[, 'result', 'error']};
+results that are available immediately are returned as done jobs.
+
+Jobs go through core.rpc: these are not sent while the breaker of the queue
+of their first task is open (rpc.CircuitOpen), their first task expires at
+its deadline, and their outcome is counted in rpc.stats().
+"""
+import time
+import uuid
+
+from celery import Signature
+
+from ..app import celery
+from ..config import JOB_KEY_TTL
+from ..contrib.db.redis_connection import get_redis
+from . import rpc
+
+_PREFIX = 'rmxbot:job'
+
+
+def done(result) -> dict:
+    """Returns a job for a result that is available."""
+    return {'jobid': None, 'state': 'SUCCESS', 'ready': True,
+            'success': True, 'result': result}
+
+
+def pending(jobid: str) -> dict:
+
+    return {'jobid': jobid, 'state': 'PENDING', 'ready': False,
+            'success': False}
+
+
+def first_task(sig: Signature) -> Signature:
+    """Returns the first task of a chain, or the task."""
+    tasks = getattr(sig, 'tasks', None)
+    return first_task(tasks[0]) if tasks else sig
+
+
+def _root_id(res) -> str:
+    """Returns the id of the first task of a chain, given its result."""
+    while getattr(res, 'parent', None) is not None:
+        res = res.parent
+    return res.id
+
+
+def _apply(sig: Signature, **options) -> str:
+    """Sending a task or a chain through rpc; returns the job id."""
+    name = first_task(sig).task
+    rpc.admit(name)
+    start = time.monotonic()
+    try:
+        res = sig.apply_async(expires=rpc.deadline_of(name), **options)
+    except Exception:
+        rpc.not_sent(name, start)
+        raise
+    rpc.sent(name, res.id, _root_id(res))
+    return res.id
+
+
+def submit(sig: Signature, key: str = None) -> dict:
+    """Enqueuing a task or a chain. Jobs with a key are started once: while
+       a job for the key is running, it is returned instead of a new one.
+    """
+    if not key:
+        return pending(_apply(sig))
+    conn = get_redis()
+    key = f'{_PREFIX}:{key}'
+    jobid = str(uuid.uuid4())
+    if not conn.set(key, jobid, nx=True, ex=JOB_KEY_TTL):
+        running = conn.get(key)
+        if running and not status(running.decode())['ready']:
+            return pending(running.decode())
+        # the job is over, without its result being available to the caller.
+        conn.set(key, jobid, ex=JOB_KEY_TTL)
+    try:
+        return pending(_apply(sig, task_id=jobid))
+    except Exception:
+        # the job was not started; the next caller starts it.
+        if conn.get(key) == jobid.encode():
+            conn.delete(key)
+        raise
+
+
+def send(name: str, **kwargs) -> dict:
+    """Enqueuing a task by name."""
+    return submit(celery.signature(name, kwargs=kwargs))
+
+
+def status(jobid: str) -> dict:
+    """Returns the job with its result, if it is ready; unknown job ids are
+       reported as pending.
+    """
+    root = rpc.observe(jobid)
+    res = celery.AsyncResult(jobid)
+    if not res.ready() and root is not None and root.ready() and \
+            not root.successful():
+        # the first task of the chain failed or expired; the job is over.
+        res = root
+    out = {'jobid': jobid, 'state': res.state, 'ready': res.ready(),
+           'success': res.successful()}
+    if res.successful():
+        out['result'] = res.result
+    elif res.failed():
+        out['error'] = repr(res.result)
+    return out
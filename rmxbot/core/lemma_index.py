@@ -0,0 +1,152 @@
+"""Index of the mapping between lemma and the words found in texts.
+
+nlp writes this mapping to matrix/lemma.json. The index is a sorted text
+file (matrix/lemma.idx) with one 'lemma<TAB>json-list-of-words' line per
+lemma; it is memory-mapped and looked up with a binary search. It is built
+when matrices are written, or lazily on first access. A process-wide LRU
+cache keeps up to LEMMA_INDEX_CACHE_SIZE open indexes, keyed on the mtime of
+lemma.json; evicted indexes are closed.
+"""
+import collections
+import json
+import mmap
+import os
+import stat
+import threading
+
+from ..config import LEMMA_INDEX_CACHE_SIZE
+
+LEMMA_FILE = 'lemma.json'
+LEMMA_INDEX_FILE = 'lemma.idx'
+
+# {matrix_path: (mtime of lemma.json, LemmaIndex)}, least recently used first
+_INDEX_CACHE = collections.OrderedDict()
+# held while indexes are read, so that these are not closed in the meantime
+_LOCK = threading.RLock()
+
+
+def read_lemma_file(path: str):
+    """Yields (lemma, words) pairs from lemma.json, as written by nlp: a json
+       list with one {'lemma': ..., 'words': [...]} object per line. Raises
+       ValueError for lines that do not hold such an object.
+    """
+    with open(path, 'r') as _file:
+        for number, line in enumerate(_file, 1):
+            line = line.strip()
+            if line in ('', '[', ']', '[]'):
+                continue
+            try:
+                item = json.loads(line.rstrip(','))
+                lemma, words = item['lemma'], item['words']
+            except (ValueError, TypeError, KeyError):
+                raise ValueError('{}:{}'.format(path, number))
+            if not isinstance(lemma, str) or not isinstance(words, list):
+                raise ValueError('{}:{}'.format(path, number))
+            yield lemma, words
+
+
+def build_lemma_index(matrix_path: str) -> str:
+    """Writing the lemma index next to lemma.json. Returns its path."""
+    entries = sorted(
+        (str(lemma).encode('utf-8'), json.dumps(words).encode('utf-8'))
+        for lemma, words in read_lemma_file(
+            os.path.join(matrix_path, LEMMA_FILE))
+        if lemma
+    )
+    path = os.path.join(matrix_path, LEMMA_INDEX_FILE)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as _file:
+        for lemma, words in entries:
+            _file.write(lemma + b'\t' + words + b'\n')
+    os.chmod(tmp_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+    os.replace(tmp_path, path)
+    return path
+
+
+def refresh_lemma_index(matrix_path: str):
+    """Building the index when matrices are written; lemma.json may not be
+       there yet.
+    """
+    if os.path.isfile(os.path.join(matrix_path, LEMMA_FILE)):
+        return build_lemma_index(matrix_path)
+    return None
+
+
+class LemmaIndex:
+    """Binary search of lemma in the memory-mapped index file."""
+
+    def __init__(self, path: str):
+
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if size else b''
+
+    def get(self, lemma: str):
+        """Returns the words for a lemma, or None."""
+        key = lemma.encode('utf-8')
+        _mm = self._mm
+        low, high = 0, len(_mm)
+        # low and high are always at the start of a line
+        while low < high:
+            mid = (low + high) // 2
+            start = _mm.rfind(b'\n', 0, mid) + 1
+            end = _mm.find(b'\n', start)
+            if end == -1:
+                end = len(_mm)
+            tab = _mm.find(b'\t', start, end)
+            line_key = _mm[start:tab]
+            if line_key < key:
+                low = end + 1
+            elif line_key > key:
+                high = start
+            else:
+                return json.loads(_mm[tab + 1:end])
+        return None
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+def get_lemma_index(matrix_path: str) -> LemmaIndex:
+    """Returns the index for a matrix directory. The index is (re)built if it
+       is missing or older than lemma.json; it may be closed once _LOCK is
+       released.
+    """
+    lemma_path = os.path.join(matrix_path, LEMMA_FILE)
+    mtime = os.stat(lemma_path).st_mtime_ns
+    with _LOCK:
+        cached = _INDEX_CACHE.get(matrix_path)
+        if cached and cached[0] == mtime:
+            _INDEX_CACHE.move_to_end(matrix_path)
+            return cached[1]
+
+        index_path = os.path.join(matrix_path, LEMMA_INDEX_FILE)
+        if not os.path.isfile(index_path) or \
+                os.stat(index_path).st_mtime_ns < mtime:
+            build_lemma_index(matrix_path)
+        index = LemmaIndex(index_path)
+        if cached:
+            cached[1].close()
+        _INDEX_CACHE[matrix_path] = (mtime, index)
+        _INDEX_CACHE.move_to_end(matrix_path)
+        while len(_INDEX_CACHE) > LEMMA_INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)[1][1].close()
+        return index
+
+
+def lemma_words(matrix_path: str, lemma_list: list) -> list:
+    """Returns the {'lemma': ..., 'words': [...]} mappings for the lemma
+       that are in the index.
+    """
+    out = []
+    with _LOCK:
+        index = get_lemma_index(matrix_path)
+        for lemma in lemma_list:
+            words = index.get(lemma)
+            if words is not None:
+                out.append({'lemma': lemma, 'words': words})
+    return out
@@ -1,15 +1,47 @@
+import collections
 import os
+import threading
 
-from ..app import celery
+from ..config import AVAILABLE_FEATURES_CACHE_SIZE, CORPUS_ROOT
+from ..contrib.db.redis_connection import get_redis
 from ..tasks.celeryconf import NLP_TASKS
+from . import rpc
+
+# features available per container: {containerid: (version, features)},
+# least recently used first; up to AVAILABLE_FEATURES_CACHE_SIZE are kept.
+_FEATURES_CACHE = collections.OrderedDict()
+_FEATURES_LOCK = threading.Lock()
+
+_GENERATION_KEY = 'rmxbot:matrix-generation:{}'
 
 
 def get_available_features(containerid, folder_path):
+    """Retrieves available features. These are read from the matrix directory
+       when the data volume is mounted; nlp is called otherwise.
+    """
+    if not os.path.isdir(CORPUS_ROOT):
+        return get_available_features_remote(containerid, folder_path)
+
+    containerid = str(containerid)
+    version = (wf_mtime(folder_path), matrix_generation(containerid))
+    with _FEATURES_LOCK:
+        cached = _FEATURES_CACHE.get(containerid)
+        if cached and cached[0] == version:
+            _FEATURES_CACHE.move_to_end(containerid)
+            return list(cached[1])
+    result = get_available_features_local(containerid, folder_path)
+    with _FEATURES_LOCK:
+        _FEATURES_CACHE[containerid] = (version, result)
+        _FEATURES_CACHE.move_to_end(containerid)
+        while len(_FEATURES_CACHE) > AVAILABLE_FEATURES_CACHE_SIZE:
+            _FEATURES_CACHE.popitem(last=False)
+    return list(result)
+
+
+def get_available_features_remote(containerid, folder_path):
     """Retrieves available features from nlp"""
-    result = celery.send_task(
-        NLP_TASKS['available_features'],
-        kwargs={'corpusid': containerid, 'path': folder_path}).get()
-    return result
+    return rpc.call(NLP_TASKS['available_features'],
+                    kwargs={'corpusid': containerid, 'path': folder_path})
 
 
 def get_available_features_local(containerid: str, folder_path: str):
@@ -27,6 +59,8 @@ def get_available_features_local(containerid: str, folder_path: str):
     dirs = os.listdir(path)
     out = []
     for _ in dirs:
+        if not _.isdigit():
+            continue
         featcount = int(_)
         # todo(): delete the snippet below
         # if not int(_) == numpy.shape(self.feat)[1]:
@@ -40,3 +74,41 @@ def get_available_features_local(containerid: str, folder_path: str):
         ))
     return out
 
+
+def wf_mtime(folder_path: str):
+    """Returns the modification time of the directory holding the features;
+       it changes when features are added or removed.
+    """
+    try:
+        return os.stat(os.path.join(folder_path, 'matrix', 'wf')).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def features_version(containerid, folder_path: str, feats: int) -> str:
+    """Returns a version string for the matrices of a number of features; it
+       changes when these are recomputed.
+    """
+    try:
+        mtime = os.stat(os.path.join(
+            folder_path, 'matrix', 'wf', str(feats))).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    return '{}.{}'.format(matrix_generation(containerid), mtime)
+
+
+def matrix_generation(containerid) -> int:
+    """Returns the generation counter of the container's matrices. The counter
+       is incremented every time the matrices are (re)computed.
+    """
+    value = get_redis().get(_GENERATION_KEY.format(containerid))
+    return int(value) if value else 0
+
+
+def invalidate_matrices(containerid) -> int:
+    """Called when matrices change; this invalidates data cached for the
+       container in all processes.
+    """
+    with _FEATURES_LOCK:
+        _FEATURES_CACHE.pop(str(containerid), None)
+    return get_redis().incr(_GENERATION_KEY.format(containerid))
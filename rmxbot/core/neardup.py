@@ -0,0 +1,195 @@
+"""Detection of near-duplicate texts in a container.
+
+Texts are split into shingles (sequences of SHINGLE_SIZE words) and get a
+MinHash signature of NUM_PERM values; the share of equal values of two
+signatures estimates the Jaccard similarity of the texts. The signature of a
+long text is computed on the MAX_SHINGLES smallest shingle hashes (a bottom-k
+sample, the same for equal texts), so that its cost is bounded; it is
+computed with numpy when it is installed. Signatures are
+cut into BANDS bands of ROWS values (locality sensitive hashing); texts that
+share a band are candidates, and candidates whose estimated similarity is
+at least NEAR_DUP_THRESHOLD are near-duplicates.
+
+The signatures of a container's texts are kept in NEAR_DUP_COLL, with a
+multikey index on (containerid, bands). Texts that are suppressed are
+recorded in SUPPRESSED_COLL.
+"""
+import datetime
+import hashlib
+import heapq
+import random
+import re
+import struct
+from typing import List
+
+import bson
+import pymongo
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ..config import NEAR_DUP_COLL, NEAR_DUP_THRESHOLD, SUPPRESSED_COLL
+from ..contrib.db.connection import get_collection
+
+_COLLECTION = get_collection(collection=NEAR_DUP_COLL)
+_SUPPRESSED = get_collection(collection=SUPPRESSED_COLL)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MAX_SHINGLES = 2048
+
+# the permutations: h -> (a * h + b) % _PRIME, for 32 bit hashes h; a * h + b
+# fits in 64 bits. These are seeded, so that signatures are the same in all
+# processes.
+_PRIME = (1 << 32) - 5
+_RANDOM = random.Random(1)
+_PERMUTATIONS = [(_RANDOM.randrange(1, _PRIME), _RANDOM.randrange(0, _PRIME))
+                 for _ in range(NUM_PERM)]
+if numpy is not None:
+    _A = numpy.array([[_[0]] for _ in _PERMUTATIONS], dtype=numpy.uint64)
+    _B = numpy.array([[_[1]] for _ in _PERMUTATIONS], dtype=numpy.uint64)
+
+_WORD = re.compile(r'\w+')
+
+INDEXES_CREATED = False
+
+
+def ensure_indexes():
+    """Creating the indexes on the collections, once per process."""
+    global INDEXES_CREATED
+    if not INDEXES_CREATED:
+        _COLLECTION.create_indexes([
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('bands', pymongo.ASCENDING)]),
+            pymongo.IndexModel([('containerid', pymongo.ASCENDING),
+                                ('file_id', pymongo.ASCENDING)]),
+        ])
+        _SUPPRESSED.create_index([('containerid', pymongo.ASCENDING),
+                                  ('created', pymongo.DESCENDING)])
+        INDEXES_CREATED = True
+
+
+def enabled() -> bool:
+    return NEAR_DUP_THRESHOLD > 0
+
+
+def shingles(text: str) -> set:
+    """Returns the 32 bit hashes of the shingles of a text."""
+    words = [_.lower() for _ in _WORD.findall(text)]
+    if not words:
+        return set()
+    size = min(SHINGLE_SIZE, len(words))
+    return set(
+        struct.unpack('<I', hashlib.blake2b(
+            ' '.join(words[idx:idx + size]).encode('utf-8'),
+            digest_size=4).digest())[0]
+        for idx in range(max(len(words) - size + 1, 0))
+    )
+
+
+def signature(text: str) -> list:
+    """Returns the MinHash signature of a text; None for empty texts."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    if len(hashes) > MAX_SHINGLES:
+        hashes = heapq.nsmallest(MAX_SHINGLES, hashes)
+    if numpy is not None:
+        values = numpy.fromiter(hashes, dtype=numpy.uint64)
+        return ((_A * values + _B) % numpy.uint64(_PRIME)).min(
+            axis=1).tolist()
+    return [min((a * _ + b) % _PRIME for _ in hashes)
+            for a, b in _PERMUTATIONS]
+
+
+def bands(sig: list) -> list:
+    """Returns the keys of the bands of a signature."""
+    fmt = '<{}I'.format(ROWS)
+    return [
+        '{}:{}'.format(idx, hashlib.blake2b(
+            struct.pack(fmt, *sig[idx * ROWS:(idx + 1) * ROWS]),
+            digest_size=8).hexdigest())
+        for idx in range(BANDS)
+    ]
+
+
+def similarity(sig: list, other: list) -> float:
+    """Returns the estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig, other) if a == b) / NUM_PERM
+
+
+def find_duplicate(containerid: (str, bson.ObjectId), sig: list):
+    """Returns the file id of the most similar text of the container and the
+       similarity, if this is at least NEAR_DUP_THRESHOLD; None otherwise.
+    """
+    if not sig:
+        return None
+    best = None
+    for doc in _COLLECTION.find(
+            {'containerid': bson.ObjectId(containerid),
+             'bands': {'$in': bands(sig)}},
+            {'_id': 0, 'file_id': 1, 'signature': 1}):
+        value = similarity(sig, doc['signature'])
+        if value >= NEAR_DUP_THRESHOLD and (not best or value > best[1]):
+            best = (doc['file_id'], value)
+    return best
+
+
+def add(containerid: (str, bson.ObjectId), fileid: str, sig: list):
+    """Adding the signature of a text to the index of the container."""
+    if not sig:
+        return None
+    ensure_indexes()
+    return _COLLECTION.insert_one({
+        'containerid': bson.ObjectId(containerid),
+        'file_id': fileid,
+        'bands': bands(sig),
+        'signature': sig
+    })
+
+
+def delete_files(containerid: (str, bson.ObjectId), fileids: List[str]):
+    """Removing texts from the index of a container."""
+    return _COLLECTION.delete_many({
+        'containerid': bson.ObjectId(containerid),
+        'file_id': {'$in': list(fileids)}
+    })
+
+
+def suppress(containerid: (str, bson.ObjectId), duplicate: tuple,
+             **kwds):
+    """Recording a text that was not added to the container; kwds describe
+       the text (url, title, file name).
+    """
+    ensure_indexes()
+    doc = {
+        'containerid': bson.ObjectId(containerid),
+        'duplicate_of': duplicate[0],
+        'similarity': duplicate[1],
+        'created': datetime.datetime.now()
+    }
+    doc.update((k, v) for k, v in kwds.items() if v is not None)
+    return _SUPPRESSED.insert_one(doc)
+
+
+def suppressed(containerid: (str, bson.ObjectId), limit: int = 1000):
+    """Returns the texts suppressed from a container, latest first."""
+    return _SUPPRESSED.find(
+        {'containerid': bson.ObjectId(containerid)},
+        {'_id': 0, 'containerid': 0}
+    ).sort('created', pymongo.DESCENDING).limit(limit)
+
+
+def check(containerid: (str, bson.ObjectId), text: str, **kwds):
+    """Returns (signature, None) for a new text, and (signature, duplicate)
+       for a near-duplicate; these are recorded as suppressed.
+    """
+    sig = signature(text)
+    duplicate = find_duplicate(containerid, sig)
+    if duplicate:
+        suppress(containerid, duplicate, **kwds)
+    return sig, duplicate
@@ -0,0 +1,82 @@
+"""Metrics of the crawls exported by scrasync to prometheus.
+
+While crawling a container, scrasync exports the series
+parse_and_save__{succes,exception,lastcall}_<containerid>; lastcall holds the
+time of the last call made by the crawler. The series of all crawls are read
+with one regex query and deleted in one request.
+"""
+import logging
+
+import requests
+
+from ..config import (PROMETHEUS_DELETE_SERIES, PROMETHEUS_HOST,
+                      PROMETHEUS_TIMEOUT, PROMETHEUS_URL)
+from . import http_request
+
+_SERIES = ('succes', 'exception', 'lastcall')
+
+
+def enabled() -> bool:
+    return bool(PROMETHEUS_HOST)
+
+
+def selector(containerids: list) -> str:
+    """Returns the selector of the crawl series of the containers."""
+    return '{{__name__=~"parse_and_save__({})_({})",job="scrasync"}}'.format(
+        '|'.join(_SERIES), '|'.join(str(_) for _ in containerids))
+
+
+def query(expr: str) -> list:
+    """Returns the result of an instant query. The query is posted, as it may
+       exceed the length of an url.
+    """
+    resp = http_request.post(f'http://{PROMETHEUS_URL}/query',
+                             data={'query': expr},
+                             timeout=PROMETHEUS_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json().get('data', {}).get('result', [])
+
+
+def crawl_series(containerids: list) -> dict:
+    """Returns the crawl metrics of containers, i.e.
+       {<containerid>: {'lastcall': <time>, 'succes': ..., ...}}; containers
+       without series are missing.
+    """
+    if not containerids:
+        return {}
+    out = {}
+    for item in query(selector(containerids)):
+        name = item.get('metric', {}).get('__name__', '')
+        series, _, containerid = name[len('parse_and_save__'):].partition('_')
+        out.setdefault(containerid, {})[series] = float(item['value'][1])
+    return out
+
+
+def lastcalls(containerids: list) -> dict:
+    """Returns the time of the last call of the crawler per container; empty
+       if prometheus is not available.
+    """
+    if not enabled() or not containerids:
+        return {}
+    try:
+        series = crawl_series(containerids)
+    except (requests.RequestException, ValueError) as err:
+        logging.warning(err)
+        return {}
+    return {k: v['lastcall'] for k, v in series.items() if 'lastcall' in v}
+
+
+def delete_crawl_series(containerids: list):
+    """Deleting the series of finished crawls in one request (this requires
+       the admin api of prometheus).
+    """
+    if not PROMETHEUS_DELETE_SERIES or not enabled() or not containerids:
+        return
+    try:
+        http_request.post(
+            f'http://{PROMETHEUS_URL}/admin/tsdb/delete_series',
+            data={'match[]': selector(containerids)},
+            timeout=PROMETHEUS_TIMEOUT
+        ).raise_for_status()
+    except requests.RequestException as err:
+        logging.warning(err)
@@ -0,0 +1,302 @@
+"""Calls to remote workers (nlp, rmxgrep, rmxcluster).
+
+A call either waits for its result (call) or is a job, polled by the client
+(core.jobs, which uses admit, sent and observe). Tasks expire at the deadline
+of their task name, so that workers that are down or behind do not pile up
+calls that were given up. Per remote queue, the number of calls waiting in a process is
+bounded, and a circuit breaker fails calls and jobs fast once
+RPC_BREAKER_FAILURES of these in a row timed out (expired) or could not be
+sent; one trial is let through after RPC_BREAKER_RESET seconds. Errors raised
+by the remote task do not open the breaker, as the worker answered.
+
+The latency, failures, timeouts and rejected calls per task name are counted
+in redis, for all processes; see stats(). The outcome of a job is counted by
+the first poll that finds its first task ready; its latency runs up to that
+poll.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+import redis
+
+from ..app import celery
+from ..config import (JOB_RESULT_EXPIRES, RPC_BREAKER_FAILURES,
+                      RPC_BREAKER_RESET, RPC_DEADLINE, RPC_MAX_CONCURRENCY)
+from ..contrib.db.redis_connection import get_redis
+from ..tasks.celeryconf import NLP_TASKS, RMXGREP_TASK
+
+# deadlines (seconds) of the tasks that do not wait RPC_DEADLINE.
+DEADLINES = {
+    NLP_TASKS['available_features']: 10,
+    NLP_TASKS['features_and_docs']: 120,
+    NLP_TASKS['kmeans_files']: 120,
+    RMXGREP_TASK['search_text']: 30,
+}
+
+# upper bounds (ms) of the latency buckets.
+BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 120000)
+
+_PREFIX = 'rmxbot:rpc'
+
+_LOCK = threading.Lock()
+_SEMAPHORES = {}
+_BREAKERS = {}
+
+
+class Error(Exception):
+    pass
+
+
+class Unavailable(Error):
+    """The call was not sent, as the workers of the queue cannot take it."""
+
+
+class CircuitOpen(Unavailable):
+    """The workers of the queue are not answering."""
+
+
+class Busy(Unavailable):
+    """The calls to the queue in flight did not end before the deadline."""
+
+
+class DeadlineExceeded(Error):
+    pass
+
+
+class RemoteError(Error):
+    """The remote task failed."""
+
+
+class CircuitBreaker:
+    """Counting the calls in a row that failed; open after max_failures,
+       half-open (one trial call) after reset seconds.
+    """
+
+    def __init__(self, max_failures: int = RPC_BREAKER_FAILURES,
+                 reset: float = RPC_BREAKER_RESET):
+
+        self.max_failures = max_failures
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened is None:
+            return 'closed'
+        if time.monotonic() - self.opened < self.reset:
+            return 'open'
+        return 'half-open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self._trial = False
+
+    def cancel(self):
+        """The allowed call was not made."""
+        with self._lock:
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened is not None or \
+                    self.failures >= self.max_failures:
+                self.opened = time.monotonic()
+
+
+def queue_of(name: str) -> str:
+    """Returns the queue of a remote task, e.g. 'nlp' for nlp.task.<name>
+       (see task_routes).
+    """
+    return name.split('.', 1)[0]
+
+
+def _get(registry: dict, queue: str, factory):
+
+    with _LOCK:
+        if queue not in registry:
+            registry[queue] = factory()
+        return registry[queue]
+
+
+def breaker(queue: str) -> CircuitBreaker:
+
+    return _get(_BREAKERS, queue, CircuitBreaker)
+
+
+def semaphore(queue: str) -> threading.BoundedSemaphore:
+
+    return _get(_SEMAPHORES, queue,
+                lambda: threading.BoundedSemaphore(RPC_MAX_CONCURRENCY))
+
+
+def _record(name: str, outcome: str, latency: float = None):
+    """Counting a call; outcome is one of 'ok', 'failures', 'timeouts',
+       'rejected'.
+    """
+    key = f'{_PREFIX}:{name}'
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby(key, 'calls', 1)
+        if outcome != 'ok':
+            pipe.hincrby(key, outcome, 1)
+        if latency is not None:
+            ms = latency * 1000
+            pipe.hincrbyfloat(key, 'latency_ms', ms)
+            idx = bisect.bisect_left(BUCKETS, ms)
+            pipe.hincrby(key, 'le_{}'.format(
+                BUCKETS[idx] if idx < len(BUCKETS) else 'inf'), 1)
+        pipe.sadd(_PREFIX, name)
+        pipe.execute()
+    except redis.RedisError as err:
+        logging.warning(err)
+
+
+def deadline_of(name: str) -> float:
+    """Returns the deadline (seconds) of a task."""
+    return DEADLINES.get(name, RPC_DEADLINE)
+
+
+def admit(name: str) -> CircuitBreaker:
+    """Returns the breaker of the task's queue; raises CircuitOpen if the
+       call may not be sent.
+    """
+    queue = queue_of(name)
+    _breaker = breaker(queue)
+    if not _breaker.allow():
+        _record(name, 'rejected')
+        raise CircuitOpen(queue)
+    return _breaker
+
+
+def sent(name: str, jobid: str, rootid: str = None):
+    """Tracking a job whose first task (rootid) is name, so that its outcome
+       is counted by observe.
+    """
+    _breaker = breaker(queue_of(name))
+    # the outcome of the job is known later; the trial slot is released.
+    _breaker.cancel()
+    try:
+        get_redis().set(f'{_PREFIX}:job:{jobid}', '{}\t{}\t{}'.format(
+            name, time.time(), rootid or jobid), ex=JOB_RESULT_EXPIRES)
+    except redis.RedisError as err:
+        logging.warning(err)
+
+
+def not_sent(name: str, start: float):
+    """Counting a job that could not be sent (the broker failed)."""
+    breaker(queue_of(name)).failure()
+    _record(name, 'failures', time.monotonic() - start)
+
+
+def observe(jobid: str):
+    """Returns the result of the first task of a tracked job, or None; its
+       outcome is counted once the task is ready. Tasks that expired count
+       as timeouts.
+    """
+    key = f'{_PREFIX}:job:{jobid}'
+    try:
+        conn = get_redis()
+        value = conn.get(key)
+        if not value:
+            return None
+        name, start, rootid = value.decode().split('\t')
+        root = celery.AsyncResult(rootid)
+        if not root.ready() or not conn.set(
+                f'{key}:counted', 1, nx=True, ex=JOB_RESULT_EXPIRES):
+            # not ready, or counted already
+            return root
+    except redis.RedisError as err:
+        logging.warning(err)
+        return None
+    latency = time.time() - float(start)
+    _breaker = breaker(queue_of(name))
+    if root.state == 'REVOKED':
+        _breaker.failure()
+        _record(name, 'timeouts', latency)
+    else:
+        _breaker.success()
+        _record(name, 'ok' if root.successful() else 'failures', latency)
+    return root
+
+
+def call(name: str, kwargs: dict = None, deadline: float = None):
+    """Sending a task and returning its result, within the deadline."""
+    deadline = deadline or deadline_of(name)
+    queue = queue_of(name)
+    _breaker = admit(name)
+
+    start = time.monotonic()
+    _semaphore = semaphore(queue)
+    if not _semaphore.acquire(timeout=deadline):
+        _breaker.cancel()
+        _record(name, 'rejected')
+        raise Busy(queue)
+    try:
+        try:
+            res = celery.send_task(name, kwargs=kwargs, expires=deadline)
+            res.get(timeout=max(deadline - (time.monotonic() - start), 0),
+                    propagate=False)
+        except CeleryTimeoutError:
+            _breaker.failure()
+            _record(name, 'timeouts', time.monotonic() - start)
+            raise DeadlineExceeded(name)
+        except Exception:
+            # the broker or the result backend failed
+            _breaker.failure()
+            _record(name, 'failures', time.monotonic() - start)
+            raise
+    finally:
+        _semaphore.release()
+
+    _breaker.success()
+    if res.failed():
+        _record(name, 'failures', time.monotonic() - start)
+        raise RemoteError(name, repr(res.result))
+    _record(name, 'ok', time.monotonic() - start)
+    return res.result
+
+
+def stats() -> dict:
+    """Returns the counters of all tasks and the state of the breakers of
+       this process.
+    """
+    conn = get_redis()
+    names = sorted(_.decode() for _ in conn.smembers(_PREFIX))
+    pipe = conn.pipeline()
+    for name in names:
+        pipe.hgetall(f'{_PREFIX}:{name}')
+    tasks = {}
+    for name, values in zip(names, pipe.execute()):
+        values = {k.decode(): float(v) for k, v in values.items()}
+        calls = values.get('calls', 0)
+        latency = values.pop('latency_ms', 0)
+        counted = calls - values.get('rejected', 0)
+        values['mean_ms'] = latency / counted if counted else None
+        tasks[name] = values
+    return {
+        'tasks': tasks,
+        'pid': os.getpid(),
+        'breakers': {k: {'state': v.state, 'failures': v.failures}
+                     for k, v in _BREAKERS.items()}
+    }
@@ -0,0 +1,71 @@
+"""Splitting texts into paragraphs, sentences and words."""
+import array
+import io
+import re
+
+# the end of a sentence: punctuation, closing quotes or brackets and spaces.
+_SENTENCE_END = re.compile(r'[.!?…]+[\'")\]»”]*\s+')
+
+_WORD = re.compile(r'\w+')
+
+
+def paragraph_offsets(_file) -> array.array:
+    """Given a file opened in binary mode, returns the (start, end) byte
+       offsets of its paragraphs as a flat array. Paragraphs are the non-empty
+       lines of the file, stripped.
+    """
+    offsets = array.array('Q')
+    position = 0
+    for line in _file:
+        text = line.decode('utf-8', errors='replace')
+        stripped = text.strip()
+        if stripped:
+            lead = len(text) - len(text.lstrip())
+            start = position + len(text[:lead].encode('utf-8'))
+            offsets.append(start)
+            offsets.append(start + len(stripped.encode('utf-8')))
+        position += len(line)
+    return offsets
+
+
+def split_sentences(text: str):
+    """Yields the (start, end) character offsets of sentences in a
+       paragraph.
+    """
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+        sentence = text[start:end].rstrip()
+        if sentence:
+            yield start, start + len(sentence)
+        start = end
+    if text[start:].strip():
+        yield start, len(text.rstrip())
+
+
+def sentence_offsets(content: bytes,
+                     paragraphs: array.array = None) -> array.array:
+    """Returns the (start, end) byte offsets of the sentences in a text as a
+       flat array; a sentence does not span paragraphs.
+    """
+    out = array.array('Q')
+    offsets = paragraphs if paragraphs is not None else \
+        paragraph_offsets(io.BytesIO(content))
+    for idx in range(0, len(offsets), 2):
+        first = offsets[idx]
+        text = content[first:offsets[idx + 1]].decode(
+            'utf-8', errors='replace')
+        position, chars = first, 0
+        for start, end in split_sentences(text):
+            position += len(text[chars:start].encode('utf-8'))
+            length = len(text[start:end].encode('utf-8'))
+            out.append(position)
+            out.append(position + length)
+            position += length
+            chars = end
+    return out
+
+
+def words(text: str) -> set:
+    """Returns the (lower case) words in a text."""
+    return set(_.lower() for _ in _WORD.findall(text))
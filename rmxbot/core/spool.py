@@ -0,0 +1,87 @@
+"""Claim checks for large task payloads.
+
+Instead of sending a large payload (i.e. the text and the links of a page)
+in a celery message, the producer writes it as json to the shared SPOOL_DIR
+and sends its reference and sha256 hash (payload_ref, payload_hash). The
+consumer reads and verifies the payload and deletes the spool file once it
+is processed. Payloads smaller than SPOOL_THRESHOLD are sent inline.
+"""
+import hashlib
+import json
+import os
+import stat
+import time
+import uuid
+
+from ..config import SPOOL_DIR, SPOOL_MAX_AGE, SPOOL_THRESHOLD
+
+
+def spool_path(ref: str) -> str:
+    """Returns the path of a spool file; refs are file names."""
+    if not ref or os.path.basename(ref) != ref or ref.startswith('.'):
+        raise ValueError(ref)
+    return os.path.join(SPOOL_DIR, ref)
+
+
+def write_payload(payload: dict) -> tuple:
+    """Writing a payload to the spool; returns its reference and hash."""
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    ref = '{}.json'.format(uuid.uuid4().hex)
+    path = spool_path(ref)
+    with open(path + '.tmp', 'wb') as _file:
+        _file.write(data)
+    os.chmod(path + '.tmp', stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+    os.replace(path + '.tmp', path)
+    return ref, hashlib.sha256(data).hexdigest()
+
+
+def read_payload(ref: str, payload_hash: str) -> dict:
+    """Returns a payload from the spool; raises ValueError if its hash does
+       not match.
+    """
+    with open(spool_path(ref), 'rb') as _file:
+        data = _file.read()
+    if hashlib.sha256(data).hexdigest() != payload_hash:
+        raise ValueError(ref)
+    return json.loads(data)
+
+
+def delete_payload(ref: str):
+
+    path = spool_path(ref)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def pack_kwargs(kwargs: dict, keys: tuple = ('data', 'links'),
+                threshold: int = SPOOL_THRESHOLD) -> dict:
+    """Used by producers: returns the task kwargs where the values of keys
+       are replaced by a claim check when their size exceeds the threshold.
+    """
+    payload = {k: kwargs[k] for k in keys if k in kwargs}
+    if len(json.dumps(payload).encode('utf-8')) <= threshold:
+        return kwargs
+    ref, payload_hash = write_payload(payload)
+    out = {k: v for k, v in kwargs.items() if k not in payload}
+    out.update(payload_ref=ref, payload_hash=payload_hash)
+    return out
+
+
+def purge_stale(max_age: int = SPOOL_MAX_AGE) -> int:
+    """Removing spool files older than max_age seconds, left by tasks that
+       failed or were lost. Returns the number of files removed.
+    """
+    if not os.path.isdir(SPOOL_DIR):
+        return 0
+    count = 0
+    before = time.time() - max_age
+    with os.scandir(SPOOL_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < before:
+                    os.remove(entry.path)
+                    count += 1
+            except FileNotFoundError:
+                continue
+    return count
@@ -0,0 +1,112 @@
+"""Sidecar index of the paragraphs and sentences of text files.
+
+For every text in a container, the store holds two sidecars with the byte
+offsets (start, end) of its paragraphs (.par) - the non-empty lines of the
+text, stripped - and of its sentences (.sen). Paragraphs and sentences are
+read with a seek, so that a page of a text or a few sentences are served
+without reading and tokenizing the whole text.
+"""
+import array
+import io
+
+from .sentences import paragraph_offsets, sentence_offsets
+from .textstore import get_store
+from .textstore.base import PARAGRAPHS_EXT, SENTENCES_EXT
+
+
+def _offsets(data: bytes) -> array.array:
+
+    offsets = array.array('Q')
+    offsets.frombytes(data)
+    return offsets
+
+
+def build_text_index(texts_path: str, fileid: str) -> tuple:
+    """Writing the paragraphs and sentences sidecars of a text. Returns the
+       offsets of paragraphs and sentences.
+    """
+    store = get_store(texts_path)
+    content = store.read(fileid)
+    paragraphs = paragraph_offsets(io.BytesIO(content))
+    sentences = sentence_offsets(content, paragraphs=paragraphs)
+
+    store.write_sidecar(fileid, PARAGRAPHS_EXT, paragraphs.tobytes())
+    store.write_sidecar(fileid, SENTENCES_EXT, sentences.tobytes())
+    return paragraphs, sentences
+
+
+def load_paragraph_index(texts_path: str, fileid: str) -> array.array:
+    """Returns the offsets of paragraphs; the sidecars are built if these do
+       not exist (i.e. older containers).
+    """
+    data = get_store(texts_path).read_sidecar(fileid, PARAGRAPHS_EXT)
+    if data is None:
+        return build_text_index(texts_path, fileid)[0]
+    return _offsets(data)
+
+
+def load_sentence_index(texts_path: str, fileid: str) -> array.array:
+    """Returns the offsets of sentences; the sidecars are built if these do
+       not exist.
+    """
+    data = get_store(texts_path).read_sidecar(fileid, SENTENCES_EXT)
+    if data is None:
+        return build_text_index(texts_path, fileid)[1]
+    return _offsets(data)
+
+
+def _read_items(texts_path: str, fileid: str, offsets: array.array,
+                numbers) -> list:
+    """Returns the items (paragraphs or sentences) given their sorted
+       numbers, with one read of the text.
+    """
+    if not numbers:
+        return []
+    first = offsets[2 * numbers[0]]
+    last = max(offsets[2 * _ + 1] for _ in numbers)
+    chunk = get_store(texts_path).read_range(fileid, first, last)
+    return [
+        chunk[offsets[2 * _] - first:offsets[2 * _ + 1] - first].decode(
+            'utf-8', errors='replace')
+        for _ in numbers
+    ]
+
+
+def _read_range(texts_path: str, fileid: str, offsets: array.array,
+                offset: int, limit: int) -> tuple:
+    """Returns the items offset to offset + limit given their offsets, along
+       with the total number of items.
+    """
+    total = len(offsets) // 2
+    offset = max(offset or 0, 0)
+    stop = total if limit is None else min(total, offset + max(limit, 0))
+    if offset >= stop:
+        return [], total
+    return _read_items(
+        texts_path, fileid, offsets, range(offset, stop)), total
+
+
+def read_paragraphs(texts_path: str, fileid: str, offset: int = 0,
+                    limit: int = None) -> tuple:
+    """Returns a page of paragraphs, along with the total number of
+       paragraphs in the file.
+    """
+    return _read_range(texts_path, fileid,
+                       load_paragraph_index(texts_path, fileid),
+                       offset, limit)
+
+
+def read_sentences(texts_path: str, fileid: str, offset: int = 0,
+                   limit: int = None) -> tuple:
+    """Returns the sentences offset to offset + limit, along with the total
+       number of sentences in the file.
+    """
+    return _read_range(texts_path, fileid,
+                       load_sentence_index(texts_path, fileid),
+                       offset, limit)
+
+
+def sentences_by_number(texts_path: str, fileid: str, numbers) -> list:
+    """Returns the sentences given their (sorted) numbers."""
+    return _read_items(texts_path, fileid,
+                       load_sentence_index(texts_path, fileid), list(numbers))
@@ -0,0 +1,22 @@
+"""Stores for the texts of a container.
+
+The texts of a container are kept either as one file per text in the text
+folder (FileStore), or appended to large segment files with an offset index
+(SegmentStore). The store of a container is set when its folder is created
+(config.TEXT_STORE) and is told by the presence of the segments folder.
+"""
+import os
+
+from ...config import SEGMENTS_FOLDER
+from .base import TextStore
+from .filestore import FileStore
+from .segmentstore import SegmentStore
+
+
+def get_store(texts_path: str) -> TextStore:
+    """Returns the store of the container given its text folder."""
+    texts_path = os.path.normpath(texts_path)
+    if os.path.isdir(os.path.join(os.path.dirname(texts_path),
+                                  SEGMENTS_FOLDER)):
+        return SegmentStore(texts_path)
+    return FileStore(texts_path)
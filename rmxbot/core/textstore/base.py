@@ -0,0 +1,80 @@
+import abc
+from typing import Iterable
+
+# the extensions of sidecars: offsets of paragraphs and sentences.
+PARAGRAPHS_EXT = '.par'
+SENTENCES_EXT = '.sen'
+SIDECAR_EXTS = (PARAGRAPHS_EXT, SENTENCES_EXT)
+
+
+class TextStore(abc.ABC):
+    """The interface of text stores. Texts are bytes (utf-8) keyed on their
+       file id; sidecars are small binary files attached to a text (i.e. the
+       offsets of paragraphs) and keyed on the file id and an extension.
+    """
+
+    def __init__(self, texts_path: str):
+
+        self.texts_path = texts_path
+
+    @abc.abstractmethod
+    def write(self, fileid: str, data: bytes):
+        """Writing a new text; raises FileExistsError if it exists."""
+
+    @abc.abstractmethod
+    def read(self, fileid: str) -> bytes:
+        """Returns a text; raises FileNotFoundError."""
+
+    def read_range(self, fileid: str, start: int, end: int) -> bytes:
+        """Returns the bytes start to end of a text."""
+        return self.read(fileid)[start:end]
+
+    @abc.abstractmethod
+    def exists(self, fileid: str) -> bool:
+        """Whether a text exists."""
+
+    @abc.abstractmethod
+    def fileids(self) -> list:
+        """Returns the ids of all texts in the store."""
+
+    @abc.abstractmethod
+    def delete(self, fileids: Iterable[str]):
+        """Deleting texts along with their sidecars; raises RuntimeError if a
+           text does not exist.
+        """
+
+    @abc.abstractmethod
+    def write_sidecar(self, fileid: str, ext: str, data: bytes):
+        """Writing (or replacing) the sidecar of a text."""
+
+    @abc.abstractmethod
+    def read_sidecar(self, fileid: str, ext: str):
+        """Returns the sidecar of a text, or None."""
+
+    def ingest(self, fileid: str):
+        """Adding a text that was written to the text folder by another
+           service (i.e. uploaded files).
+        """
+
+    def export(self) -> str:
+        """Returns a folder that holds one file per text, named after the
+           file id. This is the path given to workers that read texts (nlp).
+        """
+        return self.texts_path
+
+    def release_export(self):
+        """Called when workers are done with the exported folder."""
+
+    def garbage_ratio(self) -> float:
+        """Returns the ratio of the store's bytes held by deleted texts."""
+        return 0.0
+
+    def compact(self) -> int:
+        """Reclaiming the space of deleted texts; returns the number of
+           bytes reclaimed.
+        """
+        return 0
+
+    def needs_dictionary(self) -> bool:
+        """Returns True if a compression dictionary should be trained."""
+        return False
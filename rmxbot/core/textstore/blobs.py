@@ -0,0 +1,132 @@
+"""Content addressed blobs shared by containers.
+
+A text is written once to BLOBS_ROOT/<hash[:2]>/<hash>, where hash is the
+sha256 of its content; the text files of containers are hard links to the
+blob. The number of references to a blob is its link count less one, so a
+blob is removed when the last container file that links it is removed; the
+check and the removal are done under a lock on the blob, so that files
+released at the same time do not leave the blob behind.
+"""
+import errno
+import fcntl
+import hashlib
+import os
+import stat
+import uuid
+
+from ...config import BLOBS_ROOT
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(value: str) -> str:
+    return os.path.join(BLOBS_ROOT, value[:2], value)
+
+
+def _chmod(path: str):
+    # permissions 'read, write, execute' to user, group, other (777)
+    os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+
+
+def _tmp_path(path: str) -> str:
+    return '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+
+
+def put(data: bytes) -> str:
+    """Writing a blob, unless it exists; returns its path."""
+    path = blob_path(digest(data))
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'wb') as _file:
+        _file.write(data)
+    _chmod(tmp_path)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        # written by another process in the meantime
+        pass
+    finally:
+        os.remove(tmp_path)
+    return path
+
+
+def link(data: bytes, path: str) -> str:
+    """Creating the file path as a reference to the blob of data; raises
+       FileExistsError if path exists. Returns the digest of the data.
+    """
+    value = digest(data)
+    for _ in range(3):
+        try:
+            os.link(put(data), path)
+            return value
+        except FileNotFoundError:
+            # the blob was released by another process; it is written again
+            continue
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            # blobs on another file system; the text is not shared
+            break
+    with open(path, 'xb') as _file:
+        _file.write(data)
+    _chmod(path)
+    return value
+
+
+def adopt(path: str) -> str:
+    """Turning a file written by another service into a reference to a blob.
+       Returns the digest of the file.
+    """
+    with open(path, 'rb') as _file:
+        value = digest(_file.read())
+    _blob_path = blob_path(value)
+    os.makedirs(os.path.dirname(_blob_path), exist_ok=True)
+    try:
+        os.link(path, _blob_path)
+        return value
+    except FileExistsError:
+        pass
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        return value
+    # the blob exists; the file is replaced with a link to it
+    tmp_path = _tmp_path(path)
+    try:
+        os.link(_blob_path, tmp_path)
+    except FileNotFoundError:
+        # released in the meantime
+        return adopt(path)
+    os.replace(tmp_path, path)
+    return value
+
+
+def release(path: str, value: str = None):
+    """Removing a file; its blob is removed if the file was the last
+       reference to it. value is the digest of the file; the file is hashed
+       if it is not given.
+    """
+    if os.stat(path).st_nlink == 1:
+        # not a reference to a blob
+        os.remove(path)
+        return
+    if value is None:
+        with open(path, 'rb') as _file:
+            value = digest(_file.read())
+    _blob_path = blob_path(value)
+    try:
+        _lock = open(_blob_path, 'rb')
+    except FileNotFoundError:
+        os.remove(path)
+        return
+    with _lock:
+        fcntl.flock(_lock, fcntl.LOCK_EX)
+        # a file linked at the same time is kept, without sharing the blob
+        if os.stat(path).st_nlink == 2 and \
+                os.path.samefile(_blob_path, path):
+            os.remove(_blob_path)
+        os.remove(path)
@@ -0,0 +1,77 @@
+"""Compression of the texts in a store.
+
+Every record is written with the name of its codec: 'raw', 'zlib', 'zstd'
+or 'zstd:<number>' - zstd with the trained dictionary <number> of the
+container. zstd requires the zstandard package.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW = 'raw'
+
+
+class Codec:
+
+    def __init__(self, name: str, level: int = 6):
+
+        self.name = name
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+
+    def __init__(self, name: str, level: int = 6, dictionary: bytes = None):
+
+        super().__init__(name, level=level)
+        if zstandard is None:
+            raise RuntimeError('The zstandard package is not installed.')
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary) \
+            if dictionary else None
+
+    # compressors are not thread safe; these are created for every call.
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(
+            level=self.level, dict_data=self.dictionary).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor(
+            dict_data=self.dictionary).decompress(data)
+
+
+def get_codec(name: str, level: int = 6, dictionary: bytes = None) -> Codec:
+    """Returns the codec given its name; the dictionary is the content of the
+       trained dictionary for 'zstd:<number>' codecs.
+    """
+    if not name or name == RAW:
+        return Codec(RAW)
+    if name == 'zlib':
+        return ZlibCodec(name, level=level)
+    if name.split(':')[0] == 'zstd':
+        return ZstdCodec(name, level=level, dictionary=dictionary)
+    raise ValueError(name)
+
+
+def train_dictionary(samples: list, size: int) -> bytes:
+    """Training a zstd dictionary on sample texts."""
+    if zstandard is None:
+        raise RuntimeError('The zstandard package is not installed.')
+    return zstandard.train_dictionary(size, samples).as_bytes()
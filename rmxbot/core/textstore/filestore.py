@@ -0,0 +1,100 @@
+import os
+import stat
+from typing import Iterable
+
+from ...config import INDEX_FOLDER, TEXT_BLOBS
+from . import blobs
+from .base import SIDECAR_EXTS, TextStore
+
+# the sidecar holding the digest of a text that links a blob.
+DIGEST_EXT = '.sha256'
+
+
+class FileStore(TextStore):
+    """One file per text in the text folder of the container; sidecars are
+       files in the index folder. With TEXT_BLOBS, text files are hard links
+       to blobs shared by all containers (see blobs).
+    """
+
+    def __init__(self, texts_path: str):
+
+        super().__init__(texts_path)
+        self.index_path = os.path.join(os.path.dirname(texts_path),
+                                       INDEX_FOLDER)
+
+    def path(self, fileid: str) -> str:
+        return os.path.normpath(os.path.join(self.texts_path, fileid))
+
+    def sidecar_path(self, fileid: str, ext: str) -> str:
+        return os.path.join(self.index_path, fileid + ext)
+
+    def write(self, fileid: str, data: bytes):
+
+        path = self.path(fileid)
+        if TEXT_BLOBS:
+            self.write_sidecar(fileid, DIGEST_EXT,
+                               blobs.link(data, path).encode('ascii'))
+            return
+        with open(path, 'xb') as _file:
+            _file.write(data)
+        # permissions 'read, write, execute' to user, group, other (777)
+        os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+
+    def read(self, fileid: str) -> bytes:
+
+        with open(self.path(fileid), 'rb') as _file:
+            return _file.read()
+
+    def read_range(self, fileid: str, start: int, end: int) -> bytes:
+
+        with open(self.path(fileid), 'rb') as _file:
+            _file.seek(start)
+            return _file.read(end - start)
+
+    def exists(self, fileid: str) -> bool:
+        return os.path.isfile(self.path(fileid))
+
+    def fileids(self) -> list:
+        return [_ for _ in os.listdir(self.texts_path)
+                if os.path.isfile(os.path.join(self.texts_path, _))]
+
+    def delete(self, fileids: Iterable[str]):
+
+        for fileid in fileids:
+            path = self.path(fileid)
+            if not os.path.exists(path):
+                raise RuntimeError(path)
+            value = self.read_sidecar(fileid, DIGEST_EXT)
+            blobs.release(path, value.decode('ascii') if value else None)
+            for ext in SIDECAR_EXTS + (DIGEST_EXT,):
+                path = self.sidecar_path(fileid, ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def ingest(self, fileid: str):
+
+        if TEXT_BLOBS:
+            self.write_sidecar(fileid, DIGEST_EXT,
+                               blobs.adopt(self.path(fileid)).encode('ascii'))
+
+    def write_sidecar(self, fileid: str, ext: str, data: bytes):
+
+        if not os.path.isdir(self.index_path):
+            # containers created before sidecars existed
+            os.makedirs(self.index_path, exist_ok=True)
+            os.chmod(self.index_path,
+                     stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+        path = self.sidecar_path(fileid, ext)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as _file:
+            _file.write(data)
+        os.chmod(tmp_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+        os.replace(tmp_path, path)
+
+    def read_sidecar(self, fileid: str, ext: str):
+
+        try:
+            with open(self.sidecar_path(fileid, ext), 'rb') as _file:
+                return _file.read()
+        except FileNotFoundError:
+            return None
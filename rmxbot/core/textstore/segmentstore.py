@@ -0,0 +1,481 @@
+"""Texts appended to segment files.
+
+The segments folder of a container holds:
+
+    seg-000001.dat, ... - segment files; records (texts and sidecars)
+                          appended one after another;
+    index.log           - one line per record written or deleted:
+                          kind<TAB>fileid<TAB>segment<TAB>offset<TAB>length
+                          <TAB>codec, where kind is 't' for texts and the
+                          extension for sidecars; deleted records
+                          (tombstones) have segment -1;
+    dict-000001.zstd    - zstd dictionaries trained on the container's texts;
+    lock                - the lock taken by writers;
+    train.lock          - the lock taken while a dictionary is trained;
+    compact.lock        - the lock taken while the segments are compacted;
+    compact-<n>         - the segments being written by compaction;
+    <fileid>.export     - texts being exported, see export.
+
+Texts are compressed with the codec set in TEXT_COMPRESSION (sidecars are
+not); records keep the name of their codec, so that the setting can change
+over the life of a container.
+
+The index is loaded in every process and followed incrementally as lines are
+appended. Compaction copies the live records into new segments, replaces the
+index and removes the old segments; writers are only blocked while the index
+is replaced.
+"""
+import collections
+import fcntl
+import os
+import stat
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+from ...config import (SEGMENT_INDEX_CACHE_SIZE, SEGMENTS_FOLDER,
+                       TEXT_COMPRESSION, TEXT_COMPRESSION_LEVEL,
+                       TEXT_DICT_SAMPLES, TEXT_DICT_SIZE, TEXT_EXPORT_KEEP,
+                       TEXT_SEGMENT_SIZE)
+from .base import SIDECAR_EXTS, TextStore
+from .codecs import RAW, get_codec, train_dictionary
+
+INDEX_FILE = 'index.log'
+LOCK_FILE = 'lock'
+TRAIN_LOCK_FILE = 'train.lock'
+COMPACT_LOCK_FILE = 'compact.lock'
+COMPACT_PREFIX = 'compact-'
+TEXT = 't'
+
+# {segments path: (inode, size read, {(kind, fileid): (segment, offset,
+# length, codec)}, number of texts)}, least recently used first; up to
+# SEGMENT_INDEX_CACHE_SIZE indexes are kept.
+_INDEXES = collections.OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+# segments paths of the containers that have a dictionary; dictionaries are
+# replaced, never all removed.
+_HAS_DICTIONARY = set()
+
+# {(segments path, codec name): Codec}
+_CODECS = {}
+
+
+def _segment_name(number: int) -> str:
+    return 'seg-{:06d}.dat'.format(number)
+
+
+def _dictionary_name(number: int) -> str:
+    return 'dict-{:06d}.zstd'.format(number)
+
+
+def _chmod(path: str):
+    # permissions 'read, write, execute' to user, group, other (777)
+    os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+
+
+class SegmentStore(TextStore):
+
+    def __init__(self, texts_path: str, compression: str = None):
+
+        super().__init__(texts_path)
+        self.compression = TEXT_COMPRESSION if compression is None \
+            else compression
+        self.path = os.path.join(os.path.dirname(texts_path), SEGMENTS_FOLDER)
+        self.index_file = os.path.join(self.path, INDEX_FILE)
+
+    @contextmanager
+    def _lock(self, name: str = LOCK_FILE):
+
+        with open(os.path.join(self.path, name), 'a') as _file:
+            fcntl.flock(_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(_file, fcntl.LOCK_UN)
+
+    def _index(self, reload: bool = False) -> dict:
+        """Returns the offset index, reading the lines appended since the
+           last call.
+        """
+        return self._load_index(reload=reload)[0]
+
+    def _load_index(self, reload: bool = False) -> tuple:
+        """Returns the offset index and the number of texts."""
+        try:
+            info = os.stat(self.index_file)
+        except FileNotFoundError:
+            return {}, 0
+        with _INDEXES_LOCK:
+            inode, size, index, count = _INDEXES.get(
+                self.path, (None, 0, None, 0))
+            if inode != info.st_ino or index is None or reload:
+                inode, size, index, count = info.st_ino, 0, {}, 0
+            if info.st_size > size:
+                with open(self.index_file, 'rb') as _file:
+                    _file.seek(size)
+                    chunk = _file.read(info.st_size - size)
+                # a line that is being written is read on the next call
+                chunk = chunk[:chunk.rfind(b'\n') + 1]
+                size += len(chunk)
+                for line in chunk.decode('utf-8').splitlines():
+                    fields = line.split('\t')
+                    kind, fileid, segment, offset, length = fields[:5]
+                    exists = (kind, fileid) in index
+                    if int(segment) < 0:
+                        index.pop((kind, fileid), None)
+                        if exists and kind == TEXT:
+                            count -= 1
+                    else:
+                        if not exists and kind == TEXT:
+                            count += 1
+                        index[(kind, fileid)] = (
+                            int(segment), int(offset), int(length),
+                            fields[5] if len(fields) > 5 else RAW)
+            _INDEXES[self.path] = (inode, size, index, count)
+            _INDEXES.move_to_end(self.path)
+            while len(_INDEXES) > SEGMENT_INDEX_CACHE_SIZE:
+                _INDEXES.popitem(last=False)
+            return index, count
+
+    def _segments(self) -> list:
+        """Returns the numbers of the segment files, sorted."""
+        return sorted(int(_[4:-4]) for _ in os.listdir(self.path)
+                      if _.startswith('seg-') and _.endswith('.dat'))
+
+    def _dictionaries(self) -> list:
+        """Returns the numbers of the trained dictionaries, sorted."""
+        out = sorted(int(_[5:-5]) for _ in os.listdir(self.path)
+                     if _.startswith('dict-') and _.endswith('.zstd'))
+        if out:
+            _HAS_DICTIONARY.add(self.path)
+        return out
+
+    def _codec(self, name: str):
+        """Returns the codec of records, given its name."""
+        key = (self.path, name)
+        if key not in _CODECS:
+            dictionary = None
+            if name.startswith('zstd:'):
+                with open(os.path.join(self.path, _dictionary_name(
+                        int(name.split(':')[1]))), 'rb') as _file:
+                    dictionary = _file.read()
+            _CODECS[key] = get_codec(
+                name, level=TEXT_COMPRESSION_LEVEL, dictionary=dictionary)
+        return _CODECS[key]
+
+    def _text_codec(self):
+        """Returns the codec of the texts that are written."""
+        if self.compression == 'zstd':
+            dictionaries = self._dictionaries()
+            if dictionaries:
+                return self._codec('zstd:{}'.format(dictionaries[-1]))
+        return self._codec(self.compression or RAW)
+
+    def _encode(self, kind: str, fileid: str, data: bytes) -> tuple:
+        """Returns a record; texts are compressed."""
+        codec = self._text_codec() if kind == TEXT else self._codec(RAW)
+        return kind, fileid, codec.compress(data), codec.name
+
+    def _append(self, records: list, segments: list = None,
+                index_file: str = None) -> list:
+        """Appending records - (kind, fileid, data, codec) - to the last
+           segment (a new segment is started when it is full). Returns the
+           index lines. Must be called with the lock held.
+        """
+        segments = segments if segments is not None else self._segments()
+        number = segments[-1] if segments else 1
+        path = os.path.join(self.path, _segment_name(number))
+        if os.path.exists(path) and \
+                os.path.getsize(path) >= TEXT_SEGMENT_SIZE:
+            number += 1
+            path = os.path.join(self.path, _segment_name(number))
+        lines = []
+        is_new = not os.path.exists(path)
+        with open(path, 'ab') as _file:
+            offset = _file.tell()
+            for kind, fileid, data, codec in records:
+                _file.write(data)
+                lines.append('{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                    kind, fileid, number, offset, len(data), codec))
+                offset += len(data)
+        if is_new:
+            _chmod(path)
+        if number not in segments:
+            segments.append(number)
+        self._log(lines, index_file=index_file)
+        return lines
+
+    def _log(self, lines: list, index_file: str = None):
+
+        index_file = index_file or self.index_file
+        is_new = not os.path.exists(index_file)
+        with open(index_file, 'ab') as _file:
+            _file.write(''.join(lines).encode('utf-8'))
+        if is_new:
+            _chmod(index_file)
+
+    def _read(self, kind: str, fileid: str, start: int = 0,
+              end: int = None) -> bytes:
+
+        for reload in (False, True):
+            entry = self._index(reload=reload).get((kind, fileid))
+            if not entry:
+                continue
+            segment, offset, length, codec = entry
+            try:
+                with open(os.path.join(self.path, _segment_name(segment)),
+                          'rb') as _file:
+                    if codec == RAW:
+                        end = length if end is None else min(end, length)
+                        _file.seek(offset + start)
+                        return _file.read(max(end - start, 0))
+                    _file.seek(offset)
+                    data = self._codec(codec).decompress(_file.read(length))
+                    return data[start:end]
+            except FileNotFoundError:
+                # the segment was compacted
+                continue
+        raise FileNotFoundError(fileid)
+
+    def write(self, fileid: str, data: bytes):
+
+        with self._lock():
+            if (TEXT, fileid) in self._index():
+                raise FileExistsError(fileid)
+            self._append([self._encode(TEXT, fileid, data)])
+
+    def read(self, fileid: str) -> bytes:
+        return self._read(TEXT, fileid)
+
+    def read_range(self, fileid: str, start: int, end: int) -> bytes:
+        return self._read(TEXT, fileid, start, end)
+
+    def exists(self, fileid: str) -> bool:
+        return (TEXT, fileid) in self._index()
+
+    def fileids(self) -> list:
+        return [fileid for kind, fileid in list(self._index())
+                if kind == TEXT]
+
+    def count(self) -> int:
+        """Returns the number of texts, kept with the index."""
+        return self._load_index()[1]
+
+    def delete(self, fileids: Iterable[str]):
+
+        with self._lock():
+            index = self._index()
+            lines = []
+            for fileid in fileids:
+                if (TEXT, fileid) not in index:
+                    raise RuntimeError(fileid)
+                for kind in (TEXT,) + SIDECAR_EXTS:
+                    if (kind, fileid) in index:
+                        lines.append(
+                            '{}\t{}\t-1\t0\t0\n'.format(kind, fileid))
+                exported = os.path.join(self.texts_path, fileid)
+                if os.path.isfile(exported):
+                    os.remove(exported)
+            self._log(lines)
+
+    def write_sidecar(self, fileid: str, ext: str, data: bytes):
+
+        with self._lock():
+            self._append([self._encode(ext, fileid, data)])
+
+    def read_sidecar(self, fileid: str, ext: str):
+
+        try:
+            return self._read(ext, fileid)
+        except FileNotFoundError:
+            return None
+
+    def ingest(self, fileid: str):
+
+        path = os.path.join(self.texts_path, fileid)
+        with open(path, 'rb') as _file:
+            self.write(fileid, _file.read())
+        os.remove(path)
+
+    def export(self) -> str:
+        """Writing the texts that are not in the text folder yet; texts do
+           not change once written, so a file that is present is kept
+           unless its size is not the size of its raw record.
+        """
+        index = self._index()
+        for fileid in self.fileids():
+            path = os.path.join(self.texts_path, fileid)
+            entry = index.get((TEXT, fileid))
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            else:
+                if entry is None or entry[3] != RAW or size == entry[2]:
+                    continue
+            # written outside the text folder, which is read by nlp
+            tmp_path = os.path.join(
+                self.path, '{}.{}.export'.format(fileid, os.getpid()))
+            with open(tmp_path, 'wb') as _file:
+                _file.write(self.read(fileid))
+            _chmod(tmp_path)
+            os.replace(tmp_path, path)
+        return self.texts_path
+
+    def release_export(self):
+        """Removing the exported files, unless TEXT_EXPORT_KEEP is set."""
+        if TEXT_EXPORT_KEEP:
+            return
+        for fileid in self.fileids():
+            path = os.path.join(self.texts_path, fileid)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def garbage_ratio(self) -> float:
+        """Returns the ratio of bytes in segments that belong to deleted
+           records.
+        """
+        total = sum(
+            os.path.getsize(os.path.join(self.path, _segment_name(_)))
+            for _ in self._segments())
+        if not total:
+            return 0.0
+        live = sum(_[2] for _ in self._index().values())
+        return max(total - live, 0) / total
+
+    def compact(self) -> int:
+        """Copying the live records into new segments and removing the old
+           ones; texts are compressed with the current codec. Returns the
+           number of bytes reclaimed.
+
+           The records of a snapshot of the index are copied without the
+           writers' lock, into segments named after COMPACT_PREFIX. The lock
+           is then taken to name the new segments after the last one, replay
+           the lines logged since the snapshot and replace the index.
+        """
+        with self._lock(COMPACT_LOCK_FILE):
+            for name in os.listdir(self.path):
+                if name.startswith(COMPACT_PREFIX):
+                    os.remove(os.path.join(self.path, name))
+            with self._lock():
+                index = dict(self._index(reload=True))
+                snapshot = os.path.getsize(self.index_file) \
+                    if os.path.exists(self.index_file) else 0
+                old_segments = self._segments()
+                if old_segments:
+                    # writers append to a new segment from now on
+                    path = os.path.join(
+                        self.path, _segment_name(old_segments[-1] + 1))
+                    open(path, 'ab').close()
+                    _chmod(path)
+
+            # records are copied in the order of the old segments; the lines
+            # refer to the new segments by their position.
+            lines, number, _file = [], -1, None
+            try:
+                for (kind, fileid), entry in sorted(index.items(),
+                                                    key=lambda _: _[1]):
+                    try:
+                        _, _, data, codec = self._encode(
+                            kind, fileid, self._read(kind, fileid))
+                    except FileNotFoundError:
+                        # deleted since the snapshot
+                        continue
+                    if _file is None or _file.tell() >= TEXT_SEGMENT_SIZE:
+                        if _file is not None:
+                            _file.close()
+                        number += 1
+                        _file = open(os.path.join(
+                            self.path, COMPACT_PREFIX + str(number)), 'wb')
+                    lines.append((kind, fileid, number, _file.tell(),
+                                  len(data), codec))
+                    _file.write(data)
+            finally:
+                if _file is not None:
+                    _file.close()
+
+            with self._lock():
+                if old_segments:
+                    # the segment started for the writers, if unused
+                    path = os.path.join(
+                        self.path, _segment_name(old_segments[-1] + 1))
+                    if os.path.exists(path) and not os.path.getsize(path):
+                        os.remove(path)
+                segments = self._segments()
+                first = segments[-1] + 1 if segments else 1
+                appended = ''
+                if os.path.exists(self.index_file):
+                    with open(self.index_file, 'rb') as _log:
+                        _log.seek(snapshot)
+                        appended = _log.read().decode('utf-8')
+                # segments that received records since the snapshot are kept
+                kept = set(
+                    int(_.split('\t')[2]) for _ in appended.splitlines())
+                for idx in range(number + 1):
+                    path = os.path.join(self.path, _segment_name(first + idx))
+                    os.replace(os.path.join(
+                        self.path, COMPACT_PREFIX + str(idx)), path)
+                    _chmod(path)
+                tmp_index = self.index_file + '.tmp'
+                with open(tmp_index, 'wb') as _log:
+                    _log.write(''.join(
+                        '{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                            kind, fileid, first + idx, offset, length, codec)
+                        for kind, fileid, idx, offset, length, codec in lines
+                    ).encode('utf-8'))
+                    _log.write(appended.encode('utf-8'))
+                _chmod(tmp_index)
+                os.replace(tmp_index, self.index_file)
+                before = after = 0
+                for segment in old_segments:
+                    if segment not in kept:
+                        path = os.path.join(self.path, _segment_name(segment))
+                        before += os.path.getsize(path)
+                        os.remove(path)
+                for idx in range(number + 1):
+                    after += os.path.getsize(os.path.join(
+                        self.path, _segment_name(first + idx)))
+                codecs = set(_[3] for _ in self._index(reload=True).values())
+                for number in self._dictionaries():
+                    name = 'zstd:{}'.format(number)
+                    if name not in codecs and \
+                            name != self._text_codec().name:
+                        os.remove(os.path.join(self.path,
+                                               _dictionary_name(number)))
+                        _CODECS.pop((self.path, name), None)
+        return before - after
+
+    def needs_dictionary(self) -> bool:
+        """Returns True if a zstd dictionary should be trained for the
+           container. This is called for every text written; the folder is
+           only listed once the container holds enough texts.
+        """
+        return self.compression == 'zstd' and TEXT_DICT_SAMPLES > 0 and \
+            self.path not in _HAS_DICTIONARY and \
+            self.count() >= TEXT_DICT_SAMPLES and \
+            not self._dictionaries()
+
+    def train_dictionary(self, if_needed: bool = False) -> int:
+        """Training a zstd dictionary on the container's texts; the texts
+           written afterwards are compressed with it. Returns the number of
+           the dictionary, or None if if_needed is set and the container
+           does not need one (anymore). Writers are not blocked while the
+           dictionary is trained.
+        """
+        with self._lock(TRAIN_LOCK_FILE):
+            if if_needed and not self.needs_dictionary():
+                return None
+            samples = [self.read(_)
+                       for _ in self.fileids()[:TEXT_DICT_SAMPLES]]
+            data = train_dictionary(samples, TEXT_DICT_SIZE)
+            with self._lock():
+                dictionaries = self._dictionaries()
+                number = dictionaries[-1] + 1 if dictionaries else 1
+                path = os.path.join(self.path, _dictionary_name(number))
+                with open(path + '.tmp', 'wb') as _file:
+                    _file.write(data)
+                _chmod(path + '.tmp')
+                os.replace(path + '.tmp', path)
+                _HAS_DICTIONARY.add(self.path)
+        return number
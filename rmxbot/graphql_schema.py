@@ -4,8 +4,8 @@ from .apps.container.queries import Query as CorpusQuery
 from .apps.container.queries import (
     ContextPhrase, ContainerData, ContainerReady, ContainerStructure, DatasetReady,
     Doc, DocumentNode, Edge, Feat, FeatureContext, Features, FeatureNode,
-    FeaturesWithDocs, FileText, Graph, GraphGenerate, TextInDataset, Texts,
-    TxtDatum, Word
+    FeaturesWithDocs, FileText, Graph, GraphGenerate, Job, TextInDataset,
+    Texts, TxtDatum, Word
 )
 from .apps.container.mutations import Mutation as CorpusMutation
 from .apps.data.queries import Data
@@ -28,6 +28,6 @@ schema = graphene.Schema(
     types=[ContextPhrase, ContainerData, ContainerReady, ContainerStructure,
            DatasetReady, Doc, DocumentNode, Edge, Feat, FeatureContext,
            Features, FeatureNode, FeaturesWithDocs, FileText, Graph,
-           GraphGenerate, TextInDataset, Texts, TxtDatum, Word, Data]
+           GraphGenerate, Job, TextInDataset, Texts, TxtDatum, Word, Data]
 )
 
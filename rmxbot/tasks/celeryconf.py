@@ -1,6 +1,8 @@
 
 
 from ..config import RPC_HOST, RPC_PASS, RPC_PORT, RPC_USER, RPC_VHOST
+from ..config import (CRAWL_SWEEP_INTERVAL, JOB_RESULT_EXPIRES,
+                      SPOOL_PURGE_INTERVAL)
 
 # redis config imports
 from ..config import BROKER_HOST_NAME, REDIS_DB_NUMBER, REDIS_PASS, REDIS_PORT
@@ -20,7 +22,7 @@ result_persistent = True
 
 imports = ('rmxbot.tasks.container', 'rmxbot.tasks.data')
 
-result_expires = 30
+result_expires = JOB_RESULT_EXPIRES
 timezone = 'UTC'
 
 accept_content = ['json', 'msgpack', 'yaml']
@@ -79,6 +81,43 @@ RMXBOT_TASKS = {
 
     'crawl_metrics': 'rmxbot.tasks.container.crawl_metrics',
 
+    'migrate_urls': 'rmxbot.tasks.container.migrate_urls',
+
+    'compact_texts': 'rmxbot.tasks.container.compact_texts',
+
+    'train_text_dictionary':
+        'rmxbot.tasks.container.train_text_dictionary',
+
+    'index_context': 'rmxbot.tasks.container.index_context',
+
+    'sweep_crawls': 'rmxbot.tasks.container.sweep_crawls',
+
+    'purge_spool': 'rmxbot.tasks.data.purge_spool',
+
+    'enrich_features': 'rmxbot.tasks.container.enrich_features',
+
+    'cache_context': 'rmxbot.tasks.container.cache_context',
+
+    'kmeans_groups': 'rmxbot.tasks.container.kmeans_groups',
+
+}
+
+# periodic tasks, sent by one celery beat process (celery-beat.sh); these
+# expire after their interval, so that these do not pile up in the queue.
+beat_schedule = {
+
+    'sweep-crawls': {
+        'task': RMXBOT_TASKS['sweep_crawls'],
+        'schedule': CRAWL_SWEEP_INTERVAL,
+        'options': {'expires': CRAWL_SWEEP_INTERVAL},
+    },
+
+    'purge-spool': {
+        'task': RMXBOT_TASKS['purge_spool'],
+        'schedule': SPOOL_PURGE_INTERVAL,
+        'options': {'expires': SPOOL_PURGE_INTERVAL},
+    },
+
 }
 
 SCRASYNC_TASKS = {
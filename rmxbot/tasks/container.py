@@ -3,18 +3,24 @@ import os
 import time
 from typing import List
 
-import requests
-
+from ..apps.container import crawls, ingest
 from ..apps.container.models import (
-    ContainerModel, container_status, insert_urlobj,
+    FEATURES_CACHE, ContainerModel, container_status, insert_urlobj,
     integrity_check_ready,
     set_integrity_check_in_progress,
     set_crawl_ready)
 from ..config import (
-    CRAWL_MONITOR_COUNTDOWN, CRAWL_START_MONITOR_COUNTDOWN, PROMETHEUS_URL, SECONDS_AFTER_LAST_CALL
+    CRAWL_MONITOR_COUNTDOWN, SECONDS_AFTER_LAST_CALL,
+    TEXT_COMPACT_RATIO
 )
-from .data import delete_data
-from ..tasks.celeryconf import NLP_TASKS, SCRASYNC_TASKS, RMXBOT_TASKS
+from ..contrib.db.redis_connection import get_redis
+from ..core import context_index, neardup, prometheus
+from ..core.lemma_index import refresh_lemma_index
+from ..core.matrix_files import invalidate_matrices
+from ..core.textstore import get_store
+from .data import DICTIONARY_KEY, delete_data
+from ..tasks.celeryconf import (NLP_TASKS, RMXBOT_TASKS, RMXCLUSTER_TASKS,
+                               SCRASYNC_TASKS)
 
 from ..app import celery
 
@@ -39,9 +45,11 @@ def generate_matrices_remote(
     """ Generating matrices on the remote server. This is used when nlp lives
         on its own machine.
     """
-    corpus = ContainerModel.inst_by_id(corpusid)
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['status'])
     corpus.set_status_feats(busy=True, feats=feats, task_name=self.name,
                             task_id=self.request.id)
+    # nlp reads one file per text
+    get_store(corpus.texts_path()).export()
     kwds = {
         'corpusid': corpusid,
         'feats': int(feats),
@@ -58,21 +66,84 @@ def generate_matrices_remote(
 
 @celery.task
 def crawl_async(url_list: list = None, corpus_id=None, depth=1):
-    """Starting the crawler in scrasync. Starting the task that will monitor
-       the crawler.
+    """Starting the crawler in scrasync. The crawl is registered as active;
+       it is set as ready by sweep_crawls once no pages are saved.
     """
+    crawls.start(corpus_id)
     celery.send_task(SCRASYNC_TASKS['create'], kwargs={
         'endpoint': url_list,
         'corpusid': corpus_id,
         'depth': depth
     })
-    # the countdown argument is here to make sure that this task does not
-    # start immediately as prometheus may be empty.
-    celery.send_task(
-        RMXBOT_TASKS['monitor_crawl'],
-        args=[corpus_id],
-        countdown=CRAWL_START_MONITOR_COUNTDOWN
-    )
+
+
+@celery.task
+def sweep_crawls():
+    """Periodic task (see beat_schedule) checking all active crawls.
+
+       The last activity of a crawl is the latest of the last page saved and
+       the last call of the crawler, read from prometheus for all crawls in
+       one query. Crawls without activity for SECONDS_AFTER_LAST_CALL are
+       finished: their buffers are flushed, the integrity check is started
+       and their series are deleted. Stale buffers of the other crawls are
+       flushed.
+    """
+    activity = crawls.activity()
+    if not activity:
+        return []
+    for containerid, value in prometheus.lastcalls(list(activity)).items():
+        if containerid in activity:
+            activity[containerid] = max(activity[containerid], value)
+
+    before = crawls.cutoff()
+    finished = []
+    for containerid, last in activity.items():
+        if last > before:
+            ingest.flush_stale(containerid)
+            continue
+        if not crawls.finish(containerid, before):
+            continue
+        finished.append(containerid)
+        ingest.flush(containerid)
+        status = container_status(containerid)
+        # the container may have been deleted while crawling.
+        if status and not status.get('integrity_check_in_progress'):
+            celery.send_task(
+                RMXBOT_TASKS['integrity_check'],
+                kwargs={'corpusid': containerid}
+            )
+    prometheus.delete_crawl_series(finished)
+    return finished
+
+
+@celery.task
+def enrich_features(result: list = None, containerid: str = None,
+                    cache_key: str = None):
+    """Linked to nlp's features_and_docs: the features and docs are prepared
+       as in ContainerModel.features_job and cached under cache_key.
+    """
+    container = ContainerModel.inst_by_id(
+        containerid, fields=['large_container'])
+    features, docs = container.prepare_features(*result)
+    FEATURES_CACHE.set(cache_key, [features, docs])
+    return [features, docs]
+
+
+@celery.task
+def cache_context(result: dict = None, cache_key: str = None):
+    """Linked to rmxgrep's search_text: the result is cached under cache_key
+       (see context_index.search_job).
+    """
+    return context_index.CONTEXT_CACHE.set(cache_key, result)
+
+
+@celery.task(bind=True)
+def kmeans_groups(self, params: dict = None, k: int = None):
+    """Linked to nlp's kmeans_files; the task is replaced by rmxcluster's
+       kmeans_groups, so that the job gets the groups as its result.
+    """
+    return self.replace(celery.signature(
+        RMXCLUSTER_TASKS['kmeans_groups'], kwargs=dict(params, k=k)))
 
 
 @celery.task
@@ -81,8 +152,11 @@ def nlp_callback_success(**kwds):
 
        This task is called by the nlp container.
     """
-    corpus = ContainerModel.inst_by_id(kwds.get('corpusid'))
+    corpus = ContainerModel.inst_by_id(kwds.get('corpusid'), fields=['_id'])
+    invalidate_matrices(kwds.get('corpusid'))
+    refresh_lemma_index(corpus.matrix_path)
     corpus.update_on_nlp_callback(feats=kwds.get('feats'))
+    release_texts(kwds.get('corpusid'))
 
 
 @celery.task
@@ -135,34 +209,58 @@ def integrity_check(corpusid: str = None):
 
     set_integrity_check_in_progress(corpusid, True)
 
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
+    get_store(corpus.texts_path()).export()
     celery.send_task(NLP_TASKS['integrity_check'], kwargs={
         'corpusid': corpusid,
-        'path': ContainerModel.inst_by_id(corpusid).get_folder_path(),
+        'path': corpus.get_folder_path(),
     })
 
 
 @celery.task
 def integrity_check_callback(corpusid: str = None):
 
+    invalidate_matrices(corpusid)
+    refresh_lemma_index(
+        ContainerModel.inst_by_id(corpusid, fields=['_id']).matrix_path)
     integrity_check_ready(corpusid)
+    release_texts(corpusid)
+
+
+def release_texts(corpusid: str):
+    """Releasing the texts exported for nlp, unless nlp is still working on
+       the container.
+    """
+    corpus = ContainerModel.inst_by_id(
+        corpusid, fields=['status', 'integrity_check_in_progress'])
+    if corpus.get('integrity_check_in_progress') or \
+            any(_.get('busy') for _ in corpus.get('status') or []):
+        return
+    get_store(corpus.texts_path()).release_export()
 
 
 @celery.task(bind=True)
 def delete_data_from_container(
         self, corpusid: str = None, data_ids: List[str] = None):
 
-    corpus = ContainerModel.inst_by_id(corpusid)
+    corpus = ContainerModel.inst_by_id(
+        corpusid, fields=['urls', 'large_container'])
 
-    corpus_files_path = corpus.texts_path()
+    store = get_store(corpus.texts_path())
     dataid_fileid = corpus.dataid_fileid(data_ids=data_ids)
 
     corpus.del_data_objects(data_ids=data_ids)
 
-    for _path in [os.path.join(corpus_files_path, _[1])
-                  for _ in dataid_fileid]:
-        if not os.path.exists(_path):
-            raise RuntimeError(_path)
-        os.remove(_path)
+    store.delete(fileid for _, fileid in dataid_fileid)
+    if store.garbage_ratio() > TEXT_COMPACT_RATIO:
+        celery.send_task(RMXBOT_TASKS['compact_texts'],
+                         kwargs={'corpusid': corpusid})
+    if context_index.enabled():
+        context_index.delete_files(
+            corpusid, [fileid for _, fileid in dataid_fileid])
+    if neardup.enabled():
+        neardup.delete_files(
+            corpusid, [fileid for _, fileid in dataid_fileid])
 
     params = {
         'kwargs': { 'corpusid': corpusid, 'dataids': data_ids }
@@ -178,13 +276,61 @@ def delete_data_from_container(
     # delete_data.apply_async(**params)
 
 
+@celery.task
+def migrate_urls(corpusid: str = None):
+    """Moving the url objects of an existing container to the urls
+       collection (large container storage mode).
+    """
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['large_container'])
+    if not corpus:
+        raise RuntimeError(corpusid)
+    return corpus.migrate_urls()
+
+
+@celery.task
+def compact_texts(corpusid: str = None):
+    """Compacting the segments of a container; called when many texts have
+       been deleted.
+    """
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
+    return get_store(corpus.texts_path()).compact()
+
+
+@celery.task
+def train_text_dictionary(corpusid: str = None):
+    """Training the compression dictionary of a container and compressing
+       its texts with it. Sent by data.schedule_dictionary.
+    """
+    try:
+        corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
+        store = get_store(corpus.texts_path())
+        number = store.train_dictionary(if_needed=True)
+        if number is not None:
+            store.compact()
+        return number
+    finally:
+        get_redis().delete(DICTIONARY_KEY.format(corpusid))
+
+
+@celery.task
+def index_context(corpusid: str = None):
+    """Indexing the texts of a container for the local context engine. Sent
+       by context_index.schedule_index.
+    """
+    try:
+        corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
+        context_index.index_container(corpusid, corpus.texts_path())
+    finally:
+        get_redis().delete(context_index.INDEX_KEY.format(corpusid))
+
+
 @celery.task
 def expected_files(corpusid: str = None, file_objects: list = None):
     """Updates the container with expected files that are processed."""
     ContainerModel.update_expected_files(
         containerid=corpusid, file_objects=file_objects)
 
-    corpus = ContainerModel.inst_by_id(corpusid)
+    corpus = ContainerModel.inst_by_id(corpusid, fields=['_id'])
     return {
         'corpusid': corpusid,
         # 'vectors_path': corpus.get_vectors_path(),
@@ -198,7 +344,8 @@ def expected_files(corpusid: str = None, file_objects: list = None):
 def create_from_upload(name: str = None, file_objects: list = None):
     """Creating a container from file upload."""
     docid = str(ContainerModel.inst_new_doc(name=name))
-    corpus = ContainerModel.inst_by_id(docid)
+    # only the fields that are set below are written by save().
+    corpus = ContainerModel.inst_by_id(docid, fields=['_id'])
     corpus['expected_files'] = file_objects
     corpus['data_from_files'] = True
 
@@ -215,7 +362,8 @@ def create_from_upload(name: str = None, file_objects: list = None):
 @celery.task
 def process_crawl_resp(resp, containerid):
     """
-    Processing the crawl response.
+    Processing the crawl response. Crawls are now finished by sweep_crawls;
+    this task handles the monitoring chains started before.
     :param resp:
     :param containerid:
     :return:
@@ -223,6 +371,8 @@ def process_crawl_resp(resp, containerid):
     crawl_status = container_status(containerid)
     if resp.get('ready'):
 
+        # writing url objects that are still buffered.
+        ingest.flush(containerid)
         if not crawl_status['integrity_check_in_progress']:
 
             celery.send_task(
@@ -230,6 +380,7 @@ def process_crawl_resp(resp, containerid):
                 kwargs={'corpusid': containerid}
             )
     else:
+        ingest.flush_stale(containerid)
         celery.send_task(
             RMXBOT_TASKS['monitor_crawl'],
             args=[containerid],
@@ -274,42 +425,18 @@ def crawl_metrics(containerid: str = None):
         }
     }
     """
-    ready = False
-
-    exception = f'parse_and_save__exception_{containerid}'
-    success = f'parse_and_save__succes_{containerid}'
-    lastcall = f'parse_and_save__lastcall_{containerid}'
-    query = '{{__name__=~"{success}|{lastcall}|{exception}",job="scrasync"}}'\
-        .format(
-            success=success,
-            exception=exception,
-            lastcall=lastcall
-        )
-    endpoint = f'http://{PROMETHEUS_URL}/query?query={query}'
-    del_endpoint = 'http://{}/admin/tsdb/delete_series?match={}'.format(
-        PROMETHEUS_URL, query
-    )
-    resp = requests.get(endpoint)
-    resp = resp.json()
-    result = resp.get('data', {}).get('result', [])
-    if not result:
+    series = prometheus.crawl_series([containerid]).get(str(containerid))
+    if not series:
         return {
             'ready': True,
-            'result': result,
+            'result': [],
             'msg': 'no records in prometheus',
             'containerid': str(containerid)
         }
-    lastcall_obj = next(
-        _ for _ in result
-        if _.get('metric').get('__name__') == lastcall
-    )
-    lastcall_val = float(lastcall_obj['value'][1])
-    if time.time() - SECONDS_AFTER_LAST_CALL > lastcall_val:
-        ready = True
-        # resp = requests.post(del_endpoint)
+    lastcall = series.get('lastcall', 0)
     return {
         'containerid': str(containerid),
-        'ready': ready,
+        'ready': time.time() - SECONDS_AFTER_LAST_CALL > lastcall,
         'msg': 'crawl ready',
-        'result': result
+        'result': series
     }
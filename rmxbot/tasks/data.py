@@ -2,9 +2,41 @@ import hashlib
 import os
 from typing import List
 
-from ..apps.data.models import DataModel
-from ..apps.container.models import insert_urlobj
+from ..apps.data.models import DataModel, corpus_path, text_hash
+from ..apps.container import crawls
+from ..apps.container.ingest import buffer_urlobj, flush
 from ..app import celery
+from ..contrib.db.redis_connection import get_redis
+from ..core import context_index, neardup
+from ..core.spool import delete_payload, purge_stale, read_payload
+from ..core.text_index import build_text_index
+from ..core.textstore import get_store
+from ..tasks.celeryconf import RMXBOT_TASKS
+
+# set while train_text_dictionary is queued or running for a container; it
+# expires in case the task is lost.
+DICTIONARY_KEY = 'rmxbot:train-dictionary:{}'
+DICTIONARY_KEY_TTL = 3600
+
+
+def schedule_dictionary(corpusid: str, store):
+    """Sending train_text_dictionary if the store needs a dictionary, once
+       per container.
+    """
+    if not store.needs_dictionary():
+        return False
+    if not get_redis().set(DICTIONARY_KEY.format(corpusid), 1, nx=True,
+                           ex=DICTIONARY_KEY_TTL):
+        return False
+    celery.send_task(RMXBOT_TASKS['train_text_dictionary'],
+                     kwargs={'corpusid': corpusid})
+    return True
+
+
+@celery.task
+def purge_spool():
+    """Periodic task removing the spool files that were not consumed."""
+    return purge_stale()
 
 
 @celery.task
@@ -13,8 +45,45 @@ def create_from_webpage(corpusid: str = None,
                         title: str = None,
                         texthash: str = None,
                         data: str = None,
-                        links: list = None):
-    """ Task called within DataModel.create."""
+                        links: list = None,
+                        payload_ref: str = None,
+                        payload_hash: str = None):
+    """ Task called within DataModel.create. Large payloads (data and links)
+        are passed by reference (payload_ref, payload_hash); see core.spool.
+        The spool file is deleted once the page is saved; payloads of failed
+        tasks are left for a retry, or for spool.purge_stale.
+    """
+    active = crawls.touch(corpusid)
+    if payload_ref:
+        payload = read_payload(payload_ref, payload_hash)
+        data, links = payload.get('data'), payload.get('links')
+    result = _create_from_webpage(corpusid, endpoint, title, texthash,
+                                  data, links)
+    if payload_ref:
+        delete_payload(payload_ref)
+    if not active:
+        # a page saved after the end of the crawl; the sweeper does not
+        # flush the buffer of the container anymore.
+        flush(corpusid)
+    return result
+
+
+def _create_from_webpage(corpusid: str, endpoint: str, title: str,
+                         texthash: str, data: list, links: list):
+
+    sig = None
+    if neardup.enabled():
+        # exact duplicates are found with the hash of the text, before the
+        # (costlier) near-duplicate check; both are reported as suppressed.
+        fileid = DataModel.fileid_by_hashtxt(corpusid, text_hash(data or []))
+        if fileid:
+            neardup.suppress(corpusid, (fileid, 1.0), url=endpoint,
+                             title=title)
+            return None, None
+        sig, duplicate = neardup.check(
+            corpusid, '\n\n'.join(data or []), url=endpoint, title=title)
+        if duplicate:
+            return None, None
     doc, fileid = DataModel.create(
         data=data,
         corpus_id=corpusid,
@@ -23,7 +92,13 @@ def create_from_webpage(corpusid: str = None,
         endpoint=endpoint
     )
     if isinstance(doc, DataModel) and fileid:
-        insert_urlobj(
+        texts_path = corpus_path(corpusid=corpusid)
+        if sig:
+            neardup.add(corpusid, fileid, sig)
+        if context_index.enabled():
+            context_index.index_file(corpusid, texts_path, fileid)
+        schedule_dictionary(corpusid, get_store(texts_path))
+        buffer_urlobj(
             corpusid,
             {
                 'data_id': str(doc.get('_id')),
@@ -85,13 +160,32 @@ def create(corpusid: str = None,
         'file_name': file_name,
         'success': success,
     }
+    sig = duplicate = None
     try:
+        # raises ValueError if the container holds the same text
         doc.set_hashtxt(value=hashtxt)
-        out['texthash'] = hashtxt
     except ValueError:
+        duplicate = True
+    else:
+        out['texthash'] = hashtxt
+        if neardup.enabled():
+            with open(path, 'r', encoding=encoding, errors='replace') as _file:
+                sig, duplicate = neardup.check(
+                    corpusid, _file.read(), file_name=file_name)
+    if duplicate:
         doc.rm_doc()
         if os.path.exists(path):
             os.remove(path)
         out['success'] = False
+    else:
+        texts_path = corpus_path(corpusid=corpusid)
+        store = get_store(texts_path)
+        store.ingest(fileid)
+        build_text_index(texts_path, fileid)
+        if sig:
+            neardup.add(corpusid, fileid, sig)
+        schedule_dictionary(corpusid, store)
+        if context_index.enabled():
+            context_index.index_file(corpusid, texts_path, fileid)
 
     return out